@@ -0,0 +1,62 @@
+# Decode-once image handles shared by detection, drawing and the GUI
+import hashlib
+import os
+import cv2
+import numpy as np
+import instrument
+
+# Files larger than this are decoded from a memory map instead of being read into memory first
+memmap_threshold = 8 << 20
+
+
+class ImageHandle:
+    def __init__(self, path):
+        self.path = path
+        self._image = None
+        self._hash = None
+        self._displays = {}
+
+    def _decode(self):
+        with instrument.timer('decode'):
+            self._decode_file()
+
+    def _decode_file(self):
+        assert os.path.isfile(self.path), f"Image not found at {self.path}"
+        if os.path.getsize(self.path) > memmap_threshold:
+            data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        else:
+            data = np.fromfile(self.path, dtype=np.uint8)
+
+        # The cache key is hashed from the same bytes, so the file is only read once
+        self._hash = hashlib.sha256(data).hexdigest()
+        self._image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        assert self._image is not None, f"Could not decode image at {self.path}"
+        del data
+
+    @property
+    def image(self):
+        # Full resolution BGR array, treat as read-only
+        if self._image is None:
+            self._decode()
+        return self._image
+
+    @property
+    def content_hash(self):
+        if self._hash is None:
+            self._decode()
+        return self._hash
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def display(self, max_width, max_height):
+        # Reduced copy that fits max_width x max_height, and the scale from the original to it
+        key = (max_width, max_height)
+        if key not in self._displays:
+            height, width = self.image.shape[:2]
+            ratio = min(max_width / width, max_height / height)
+            new_size = (int(width * ratio), int(height * ratio))
+            interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+            self._displays[key] = (cv2.resize(self.image, new_size, interpolation=interpolation), ratio)
+        return self._displays[key]
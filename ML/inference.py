@@ -1,22 +1,98 @@
 import sys
 import os
-import torch
+import json
+import copy
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from PIL import Image
+from postprocess import Holds, filter_holds
+from imaging import ImageHandle
+import instrument
 
 # Adjust the path to your YOLOv5 directory
 yolov5_path = os.path.join(os.path.dirname(__file__), "../yolov5")
-sys.path.append(yolov5_path)
-from models.common import DetectMultiBackend
-from utils.torch_utils import select_device
-from utils.general import non_max_suppression, scale_boxes
+sys.path.append(yolov5_path)  # Only makes its modules importable, nothing is loaded yet
 
-device = select_device('0' if torch.cuda.is_available() else 'cpu')
+# torch, YOLOv5 and the weights are only loaded on first use, see get_model
+model_path = os.environ.get('BTE_MODEL', os.path.join(os.path.dirname(__file__), 'Model/best.pt'))
+model = None
+device = None
 
-model_path = 'ML/Model/best.pt' 
-model = DetectMultiBackend(model_path, device=device)
-model.eval()
+# Inference backend, exported from model_path on first use:
+#   pytorch      eager fp32 model, the default
+#   torchscript  traced model, fixed batch size of 1
+#   onnx         ONNX Runtime, dynamic batch
+#   onnx-int8    ONNX Runtime with dynamic int8 quantized weights
+backends = ('pytorch', 'torchscript', 'onnx', 'onnx-int8')
+backend = os.environ.get('BTE_BACKEND', 'pytorch')
+
+# Address of a running inference service (ML/service.py). When set, detect_holds asks it for holds
+# instead of loading a model in this process. None runs the model here.
+service_address = os.environ.get('BTE_INFERENCE_SERVICE')
+
+def set_service(address):
+    global service_address
+    service_address = address
+
+def set_backend(name):
+    # Switching backend drops the loaded model, the next detection loads the new one
+    global backend, model, _model_identity
+    assert name in backends, f"Unknown backend {name}, expected one of {backends}"
+    backend = name
+    model = None
+    _model_identity = None
+
+def backend_weights(name=None):
+    name = name or backend
+    root, _ = os.path.splitext(model_path)
+    return {
+        'pytorch': model_path,
+        'torchscript': root + '.torchscript',
+        'onnx': root + '.onnx',
+        'onnx-int8': root + '-int8.onnx',
+    }[name]
+
+def export_model(name=None):
+    # Export model_path for a backend if that hasn't been done yet, returns the weights path
+    name = name or backend
+    weights = backend_weights(name)
+    if os.path.isfile(weights):
+        return weights
+
+    if name == 'onnx-int8':
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(export_model('onnx'), weights, weight_type=QuantType.QUInt8)
+        return weights
+
+    import export
+    export.run(weights=model_path, imgsz=(640, 640), device='cpu', include=(name,), dynamic=(name == 'onnx'))
+    assert os.path.isfile(weights), f"Export to {name} did not produce {weights}"
+    return weights
+
+def get_model(warmup=False):
+    global model, device
+    if model is None:
+        import torch
+        from models.common import DetectMultiBackend
+        from utils.torch_utils import select_device
+
+        device = select_device('0' if torch.cuda.is_available() else 'cpu')
+        model = DetectMultiBackend(export_model(), device=device)
+        model.eval()
+        if warmup:
+            # One dummy forward pass so the first real image doesn't pay for it
+            model.warmup(imgsz=(1, 3, 640, 640))
+    return model
+
+# Detection cache, keyed by image content + model weights so each image goes through the model once.
+# Recent results are kept in memory, and on disk as well if a cache directory is set.
+cache_size = 32
+cache_dir = os.environ.get('BTE_DETECTION_CACHE')
+_detection_cache = OrderedDict()
+_model_identity = None
 
 def letterbox_image(image, desired_size=(640, 640)):
     ih, iw = image.shape[:2]
@@ -34,26 +110,131 @@ def letterbox_image(image, desired_size=(640, 640)):
 
     return new_image, scale, dx, dy
 
-def detect_holds(image_path):
-    img0 = cv2.imread(image_path)  # Original image
-    assert img0 is not None, f"Image not found at {image_path}"
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def model_identity():
+    global _model_identity
+    if _model_identity is None:
+        _model_identity = file_hash(export_model())[:16]
+    return _model_identity
+
+def set_cache_dir(path):
+    # None turns the on-disk tier off
+    global cache_dir
+    cache_dir = path
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+
+def clear_cache():
+    _detection_cache.clear()
+
+def cache_key(image):
+    # image is a path or an ImageHandle, a handle hashes the bytes it already decoded
+    if isinstance(image, ImageHandle):
+        return f"{model_identity()}-{image.content_hash}"
+    return f"{model_identity()}-{file_hash(image)}"
+
+def cache_get(key):
+    if key in _detection_cache:
+        _detection_cache.move_to_end(key)
+        return copy.deepcopy(_detection_cache[key])
+
+    disk_path = os.path.join(cache_dir, key + '.json') if cache_dir else None
+    if disk_path and os.path.isfile(disk_path):
+        with open(disk_path) as f:
+            holds = json.load(f)
+        cache_put(key, holds, write_disk=False)
+        return copy.deepcopy(holds)
+    return None
+
+def cache_put(key, holds, write_disk=True):
+    _detection_cache[key] = holds
+    if len(_detection_cache) > cache_size:
+        _detection_cache.popitem(last=False)
+
+    if write_disk and cache_dir:
+        disk_path = os.path.join(cache_dir, key + '.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(disk_path + '.tmp', 'w') as f:
+            json.dump(holds, f)
+        os.replace(disk_path + '.tmp', disk_path)
+
+def detect_holds(image, use_cache=True, columnar=False):
+    # image is a path or an ImageHandle
+    # columnar=True returns a postprocess.Holds instead of a list of hold dicts
+    if service_address is not None:
+        import service
+        holds = service.request(service_address, image.path if isinstance(image, ImageHandle) else image, use_cache)
+        return Holds.from_dicts(holds) if columnar else holds
+
+    if not use_cache:
+        holds = run_detection(image)
+        return holds if columnar else holds.to_dicts()
+
+    if not isinstance(image, ImageHandle):
+        assert os.path.isfile(image), f"Image not found at {image}"
+    key = cache_key(image)
+
+    holds = cache_get(key)
+    if holds is None:
+        detected = run_detection(image)
+        cache_put(key, detected.to_dicts())
+        return detected if columnar else detected.to_dicts()
+    return Holds.from_dicts(holds) if columnar else holds
+
+def load_image(image):
+    # Decode (unless image is an already decoded ImageHandle) and letterbox one image,
+    # safe to run on worker threads (cv2 releases the GIL)
+    if isinstance(image, ImageHandle):
+        img0 = image.image  # Original image
+    else:
+        with instrument.timer('decode'):
+            img0 = cv2.imread(image)
+        assert img0 is not None, f"Image not found at {image}"
 
     # Resize image with aspect ratio preserved
-    img, scale, dx, dy = letterbox_image(img0, desired_size=(640, 640))
+    with instrument.timer('letterbox'):
+        img, scale, dx, dy = letterbox_image(img0, desired_size=(640, 640))
     img = img[:, :, ::-1].transpose(2, 0, 1)
     img = np.ascontiguousarray(img)
-    img = torch.from_numpy(img).to(device)
-    img = img.float() / 255.0 
-    if img.ndimension() == 3:
-        img = img.unsqueeze(0)
+    return img, (scale, dx, dy, img0.shape[:2])
+
+def predict(images):
+    # Batched forward pass + NMS over a list of letterboxed CHW uint8 images
+    import torch
+    from utils.general import non_max_suppression
+
+    model = get_model()
+    batch = torch.from_numpy(np.stack(images)).to(device)
+    batch = batch.float() / 255.0
 
-    pred = model(img)
+    with torch.inference_mode(), instrument.timer('forward'):
+        if backend == 'torchscript' and len(batch) > 1:
+            # The traced model only takes the batch size it was exported with
+            preds = [model(batch[i:i + 1]) for i in range(len(batch))]
+            pred = torch.cat([p[0] if isinstance(p, (list, tuple)) else p for p in preds])
+        else:
+            pred = model(batch)
 
     # Remove duplicate detections
-    pred = non_max_suppression(pred)[0]
+    with instrument.timer('nms'):
+        return non_max_suppression(pred)
+
+def to_holds(pred, letterbox):
+    # Convert one image's NMS output back to columnar holds in original image coordinates
+    with instrument.timer('to_holds'):
+        scale, dx, dy, (height, width) = letterbox
+        names = get_model().names
+
+        if pred is None or not len(pred):
+            print("No holds detected.")
+            return Holds.from_prediction(np.zeros((0, 6)), names)
 
-    holds = []
-    if pred is not None and len(pred):
         # Adjust boxes from padded image back to original image size
         pred[:, 0] -= dx
         pred[:, 1] -= dy
@@ -62,46 +243,210 @@ def detect_holds(image_path):
         pred[:, :4] /= scale
 
         # Clip boxes to image dimensions
-        pred[:, 0].clamp_(0, img0.shape[1])
-        pred[:, 1].clamp_(0, img0.shape[0])
-        pred[:, 2].clamp_(0, img0.shape[1])
-        pred[:, 3].clamp_(0, img0.shape[0])
-
-        for idx, (*xyxy, conf, cls) in enumerate(pred):
-            xyxy = [float(x.item()) for x in xyxy]
-            conf = float(conf.item())
-            cls = int(cls.item())
-            hold = {
-                'id': idx,
-                'class': model.names[cls],  # Get class name
-                'confidence': conf,
-                'box': xyxy,  # [xmin, ymin, xmax, ymax]
-                'center': [(xyxy[0] + xyxy[2]) / 2, (xyxy[1] + xyxy[3]) / 2],
-            }
-            holds.append(hold)
+        pred[:, 0].clamp_(0, width)
+        pred[:, 1].clamp_(0, height)
+        pred[:, 2].clamp_(0, width)
+        pred[:, 3].clamp_(0, height)
+
+        return Holds.from_prediction(pred.cpu().numpy(), names)
+
+def run_detection(image):
+    # One forward pass of the model, no caching, returns columnar holds
+    img, letterbox = load_image(image)
+    return to_holds(predict([img])[0], letterbox)
+
+def detect_holds_batch(image_paths, batch_size=8, workers=4, use_cache=True, columnar=False):
+    # Detect holds on many images: worker threads decode and letterbox ahead of the model,
+    # which runs batched forward passes. Returns one hold list per path, in order.
+    results = [None] * len(image_paths)
+    keys = [None] * len(image_paths)
+    pending = []
+    for i, image_path in enumerate(image_paths):
+        if use_cache:
+            keys[i] = cache_key(image_path)
+            results[i] = cache_get(keys[i])
+        if results[i] is None:
+            pending.append(i)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded number of decoded images in flight
+        queued = deque()
+        next_pending = 0
+        while next_pending < len(pending) or queued:
+            while next_pending < len(pending) and len(queued) < batch_size * 2:
+                i = pending[next_pending]
+                queued.append((i, pool.submit(load_image, image_paths[i])))
+                next_pending += 1
+
+            batch = [queued.popleft() for _ in range(min(batch_size, len(queued)))]
+            loaded = [future.result() for _, future in batch]
+            preds = predict([img for img, _ in loaded])
+            for (i, _), (_, letterbox), pred in zip(batch, loaded, preds):
+                results[i] = to_holds(pred, letterbox)
+                if use_cache:
+                    cache_put(keys[i], results[i].to_dicts())
+
+    # Cached results are dicts, fresh ones columnar
+    for i, holds in enumerate(results):
+        if columnar and not isinstance(holds, Holds):
+            results[i] = Holds.from_dicts(holds)
+        elif not columnar and isinstance(holds, Holds):
+            results[i] = holds.to_dicts()
+    return results
+
+def tile_origins(length, tile, stride):
+    # Start offsets of overlapping tiles along one axis, the last tile ends on the image edge
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+def detect_holds_tiled(image, tile=640, overlap=0.25, batch_size=8, workers=1, iou_thres=0.45,
+                       use_cache=True, columnar=False):
+    # Tiled inference for large photos. Overlapping tile x tile crops of the original photo go through
+    # the model at its 640 input size, so small footholds keep their pixels instead of being shrunk
+    # with the whole wall. Boxes are mapped back to the photo and merged across tiles with NMS.
+    # Larger tiles or less overlap mean fewer forward passes and lower recall on small holds.
+    # workers > 1 runs batches on that many threads, torch releases the GIL during the forward pass.
+    import torch
+    from torchvision.ops import batched_nms
+
+    if not isinstance(image, ImageHandle):
+        image = ImageHandle(image)
+
+    # tiled2: results cached before big holds cut by tile edges were kept miss them
+    key = f"{cache_key(image)}-tiled2-{tile}-{overlap}-{iou_thres}" if use_cache else None
+    holds = cache_get(key) if use_cache else None
+    if holds is not None:
+        return Holds.from_dicts(holds) if columnar else holds
+
+    model = get_model()
+    img0 = image.image
+    height, width = img0.shape[:2]
+    stride = max(1, int(tile * (1 - overlap)))
+
+    tiles = []
+    for y0 in tile_origins(height, tile, stride):
+        for x0 in tile_origins(width, tile, stride):
+            crop = img0[y0:y0 + tile, x0:x0 + tile]
+            img, scale, dx, dy = letterbox_image(crop, desired_size=(640, 640))
+            img = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1))
+            tiles.append((img, (x0, y0, crop.shape[1], crop.shape[0], scale, dx, dy)))
+
+    batches = [tiles[i:i + batch_size] for i in range(0, len(tiles), batch_size)]
+    def run_batch(batch):
+        return predict([img for img, _ in batch])
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            preds = list(pool.map(run_batch, batches))
+    else:
+        preds = [run_batch(batch) for batch in batches]
+
+    edge = 2  # px, boxes this close to a tile edge inside the photo are cut off by it
+    rows, tile_ids, cuts = [], [], []
+    tile_preds = [pred for batch_preds in preds for pred in batch_preds]
+    for tile_id, ((_, (x0, y0, crop_w, crop_h, scale, dx, dy)), pred) in enumerate(zip(tiles, tile_preds)):
+        if pred is None or not len(pred):
+            continue
+        pred = pred.cpu().numpy()
+
+        # Back to crop coordinates
+        pred[:, [0, 2]] = (pred[:, [0, 2]] - dx) / scale
+        pred[:, [1, 3]] = (pred[:, [1, 3]] - dy) / scale
+
+        cut = np.zeros(len(pred), dtype=bool)
+        if x0 > 0:
+            cut |= pred[:, 0] <= edge
+        if y0 > 0:
+            cut |= pred[:, 1] <= edge
+        if x0 + crop_w < width:
+            cut |= pred[:, 2] >= crop_w - edge
+        if y0 + crop_h < height:
+            cut |= pred[:, 3] >= crop_h - edge
+
+        # Then to photo coordinates
+        pred[:, [0, 2]] += x0
+        pred[:, [1, 3]] += y0
+        rows.append(pred)
+        tile_ids.append(np.full(len(pred), tile_id))
+        cuts.append(cut)
+
+    if rows:
+        pred = merge_tile_edges(np.concatenate(rows), np.concatenate(tile_ids), np.concatenate(cuts))
+        pred[:, [0, 2]] = pred[:, [0, 2]].clip(0, width)
+        pred[:, [1, 3]] = pred[:, [1, 3]].clip(0, height)
+
+        # Cross-tile NMS, per class, highest confidence first
+        pred = torch.from_numpy(np.ascontiguousarray(pred, dtype=np.float32))
+        keep = batched_nms(pred[:, :4], pred[:, 4], pred[:, 5].long(), iou_thres)
+        holds = Holds.from_prediction(pred[keep].numpy(), model.names)
     else:
         print("No holds detected.")
+        holds = Holds.from_prediction(np.zeros((0, 6)), model.names)
+
+    if use_cache:
+        cache_put(key, holds.to_dicts())
+    return holds if columnar else holds.to_dicts()
 
-    return holds
+def merge_tile_edges(pred, tile_ids, cut, contain=0.9):
+    # pred is (n, 6) NMS rows from every tile in photo coordinates, cut marks boxes that touch an inner
+    # tile edge. A cut box is dropped when a whole box of the same class from another tile covers it.
+    # Holds bigger than the tile overlap are cut in every tile they show up in, their pieces are joined
+    # into one box instead of being lost.
+    whole, pieces, piece_tiles = pred[~cut], pred[cut], tile_ids[cut]
+    if not len(pieces):
+        return whole
 
-def filter_holds(holds, target_class):
-    filtered_holds = [hold for hold in holds if hold['class'] == target_class]
-    return sorted(filtered_holds, key=lambda x: x['center'][1], reverse=True) 
+    def intersection(a, b):
+        w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+        h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+        return np.clip(w, 0, None) * np.clip(h, 0, None)
+
+    if len(whole):
+        area = np.maximum((pieces[:, 2] - pieces[:, 0]) * (pieces[:, 3] - pieces[:, 1]), 1e-9)
+        covered = intersection(pieces, whole) >= contain * area[:, None]
+        covered &= pieces[:, 5][:, None] == whole[:, 5][None, :]
+        keep = ~covered.any(axis=1)
+        pieces, piece_tiles = pieces[keep], piece_tiles[keep]
+
+    # Overlapping pieces of the same class from different tiles are one hold
+    touching = (intersection(pieces, pieces) > 0) & (pieces[:, 5][:, None] == pieces[None, :, 5]) \
+        & (piece_tiles[:, None] != piece_tiles[None, :])
+    labels = np.arange(len(pieces))
+    for i, j in zip(*np.nonzero(np.triu(touching, 1))):
+        labels[labels == labels[j]] = labels[i]
+
+    joined = []
+    for label in np.unique(labels):
+        group = pieces[labels == label]
+        joined.append([group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max(),
+                       group[:, 4].max(), group[0, 5]])
+    return np.concatenate([whole, np.array(joined, dtype=pred.dtype).reshape(-1, 6)])
+
+def draw_holds(image, holds, max_size=None):
+    # image is a path or an ImageHandle. With max_size=(width, height) the holds are drawn on a
+    # reduced display copy that fits in it rather than on the full resolution photo.
+    if not isinstance(image, ImageHandle):
+        image = ImageHandle(image)
+    if max_size is None:
+        output_image, scale = image.image.copy(), 1.0
+    else:
+        display, scale = image.display(*max_size)
+        output_image = display.copy()
 
-def draw_holds(image_path, holds):
-    image = cv2.imread(image_path)
-    assert image is not None, f"Image not found at {image_path}"
-    output_image = image.copy()
     box_colour = (0, 0, 255)
-    box_thickness = 4
+    box_thickness = max(1, round(4 * scale))
     label_colour = (255, 0, 0)
+    label_thickness = max(1, round(2 * scale))
     count = 1
     for idx, hold in enumerate(holds, start=1):
-        x1, y1, x2, y2 = map(int, hold['box'])
+        x1, y1, x2, y2 = (int(v * scale) for v in hold['box'])
         cv2.rectangle(output_image, (x1, y1), (x2, y2), box_colour, box_thickness)
         label = str(count)
-        cv2.putText(output_image, label, (x1 + 5, y1 + 25),
-                    cv2.FONT_HERSHEY_DUPLEX, 5, label_colour, 2)
+        cv2.putText(output_image, label, (x1 + round(5 * scale), y1 + round(25 * scale)),
+                    cv2.FONT_HERSHEY_DUPLEX, max(0.4, 5 * scale), label_colour, label_thickness)
         count += 1
     return output_image
 
@@ -111,11 +456,13 @@ def display_image(image, window_name='Image'):
     cv2.destroyAllWindows()
 
 def generate_image(image_path, target_class):
-    holds = detect_holds(image_path)
+    # Decode once for both detection and drawing
+    image = ImageHandle(image_path)
+    holds = detect_holds(image)
 
     filtered_holds = filter_holds(holds, target_class)
 
-    image = draw_holds(image_path, filtered_holds)
+    image = draw_holds(image, filtered_holds)
     # if image is not None:
     #     # display_image(image)
     #     cv2.imwrite('output_image.jpg', image)
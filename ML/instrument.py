@@ -0,0 +1,112 @@
+# Stage timers and counters for detect -> filter -> plan, off by default.
+# Turn on with enable() or BTE_INSTRUMENT=1. With BTE_TRACE=path.json the Chrome trace
+# (chrome://tracing, Perfetto) is written there when the process exits.
+# Timings are per process, process pool workers keep their own.
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager, nullcontext
+
+trace_path = os.environ.get('BTE_TRACE')
+enabled = os.environ.get('BTE_INSTRUMENT') == '1' or bool(trace_path)
+max_events = 100000  # Trace events kept, totals keep counting after that
+
+_timers = {}  # name -> [calls, total seconds, max seconds]
+_counters = {}  # name -> total
+_events = []  # (name, start, seconds, thread id)
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_null = nullcontext()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def timer(name):
+    # with instrument.timer('stage'): ... costs one call and a check while disabled
+    return _timed(name) if enabled else _null
+
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter() - start)
+
+
+def record(name, start, seconds):
+    with _lock:
+        entry = _timers.get(name)
+        if entry is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        if len(_events) < max_events:
+            _events.append((name, start, seconds, threading.get_ident()))
+
+
+def count(name, n=1):
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    with _lock:
+        return {
+            'timers': {name: {'calls': calls, 'seconds': total, 'max_seconds': longest}
+                       for name, (calls, total, longest) in _timers.items()},
+            'counters': dict(_counters),
+        }
+
+
+def summary():
+    # Text table for the GUI stats panel and the command line
+    data = snapshot()
+    lines = [f"{'stage':<22}{'calls':>7}{'total ms':>11}{'mean ms':>10}"]
+    for name, t in sorted(data['timers'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append(f"{name:<22}{t['calls']:>7}{t['seconds'] * 1000:>11.1f}{t['seconds'] * 1000 / t['calls']:>10.2f}")
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"{name:<29}{value:>11}")
+    return '\n'.join(lines)
+
+
+def export_json(path):
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+def export_chrome_trace(path):
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    trace = [
+        {'name': name, 'ph': 'X', 'ts': (start - _origin) * 1e6, 'dur': seconds * 1e6, 'pid': os.getpid(), 'tid': tid}
+        for name, start, seconds, tid in events
+    ]
+    end = max((start + seconds for _, start, seconds, _ in events), default=_origin)
+    trace += [
+        {'name': name, 'ph': 'C', 'ts': (end - _origin) * 1e6, 'pid': os.getpid(), 'args': {'value': value}}
+        for name, value in counters.items()
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+
+if trace_path:
+    atexit.register(export_chrome_trace, trace_path)
@@ -0,0 +1,135 @@
+# Pure Python/NumPy helpers for detection results, importable without torch or the model
+import numpy as np
+import instrument
+
+
+class Holds:
+    # Columnar detection results, one row per hold. Class names are stored once in names,
+    # cls holds indices into it. ids are the detection ids and follow the rows around.
+    def __init__(self, boxes, conf, cls, names, ids=None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)  # [xmin, ymin, xmax, ymax]
+        self.conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        self.names = tuple(names)
+        self.ids = np.arange(len(self.boxes)) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.centers = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+
+    @classmethod
+    def from_prediction(cls, pred, names):
+        # pred is an (n, 6) array of NMS output rows: xyxy, conf, class
+        pred = np.asarray(pred).reshape(-1, 6)
+        names = list(names.values()) if isinstance(names, dict) else names
+        return cls(pred[:, :4], pred[:, 4], pred[:, 5], names)
+
+    @classmethod
+    def from_dicts(cls, holds):
+        names = list(dict.fromkeys(hold['class'] for hold in holds))
+        codes = {name: code for code, name in enumerate(names)}
+        return cls(
+            [hold['box'] for hold in holds],
+            [hold['confidence'] for hold in holds],
+            [codes[hold['class']] for hold in holds],
+            names,
+            [hold['id'] for hold in holds],
+        )
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def select(self, rows):
+        # rows is a boolean mask or an array of row indices
+        return Holds(self.boxes[rows], self.conf[rows], self.cls[rows], self.names, self.ids[rows])
+
+    def of_class(self, target_class):
+        if target_class not in self.names:
+            return self.select(np.zeros(len(self), dtype=bool))
+        return self.select(self.cls == self.names.index(target_class))
+
+    def sorted_by_y(self, reverse=True):
+        # Stable, like sorted(), so equal rows keep their order
+        key = -self.centers[:, 1] if reverse else self.centers[:, 1]
+        return self.select(np.argsort(key, kind='stable'))
+
+    def sorted_by_x(self, reverse=True):
+        key = -self.centers[:, 0] if reverse else self.centers[:, 0]
+        return self.select(np.argsort(key, kind='stable'))
+
+    def by_class(self):
+        # {class name: holds of that class sorted like filter_holds}, from a single sort of all rows
+        order = np.lexsort((-self.centers[:, 1], self.cls))
+        groups = np.split(order, np.flatnonzero(np.diff(self.cls[order])) + 1)
+        return {self.names[self.cls[rows[0]]]: self.select(rows) for rows in groups if len(rows)}
+
+    def to_dicts(self):
+        # The list-of-dicts form detect_holds has always returned
+        with instrument.timer('to_dicts'):
+            return self._to_dicts()
+
+    def _to_dicts(self):
+        boxes = self.boxes.tolist()
+        centers = self.centers.tolist()
+        return [
+            {
+                'id': hold_id,
+                'class': self.names[code],
+                'confidence': conf,
+                'box': box,
+                'center': center,
+            }
+            for hold_id, code, conf, box, center in zip(self.ids.tolist(), self.cls.tolist(), self.conf.tolist(), boxes, centers)
+        ]
+
+
+def box_iou(boxes1, boxes2):
+    # Pairwise IoU of two (n, 4) and (m, 4) xyxy box arrays, (n, m) result
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+    area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+    union = area1[:, None] + area2[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def compare_holds(reference, other, iou_thres=0.5):
+    # How well two detections of the same image agree, e.g. a new backend against the baseline.
+    # Boxes are paired greedily by IoU, pairs need at least iou_thres overlap.
+    reference = reference if isinstance(reference, Holds) else Holds.from_dicts(reference)
+    other = other if isinstance(other, Holds) else Holds.from_dicts(other)
+
+    iou = box_iou(reference.boxes, other.boxes)
+    pairs = []
+    used_reference, used_other = set(), set()
+    for flat in np.argsort(-iou, axis=None, kind='stable'):
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < iou_thres:
+            break
+        if i not in used_reference and j not in used_other:
+            pairs.append((i, j, iou[i, j]))
+            used_reference.add(i)
+            used_other.add(j)
+
+    class_matches = sum(reference.names[reference.cls[i]] == other.names[other.cls[j]] for i, j, _ in pairs)
+    return {
+        'reference': len(reference),
+        'other': len(other),
+        'matched': len(pairs),
+        'recall': len(pairs) / len(reference) if len(reference) else 1.0,
+        'precision': len(pairs) / len(other) if len(other) else 1.0,
+        'mean_iou': float(np.mean([pair_iou for _, _, pair_iou in pairs])) if pairs else 0.0,
+        'class_agreement': class_matches / len(pairs) if pairs else 0.0,
+    }
+
+
+def filter_holds(holds, target_class):
+    with instrument.timer('filter_holds'):
+        return _filter_holds(holds, target_class)
+
+
+def _filter_holds(holds, target_class):
+    if isinstance(holds, Holds):
+        return holds.of_class(target_class).sorted_by_y()
+    filtered_holds = [hold for hold in holds if hold['class'] == target_class]
+    return sorted(filtered_holds, key=lambda x: x['center'][1], reverse=True) 
@@ -0,0 +1,217 @@
+# Local inference service: one process owns the model and runs detect_holds for any number of GUI/CLI
+# processes, over a Unix socket or localhost TCP. Requests that arrive together share a forward pass.
+# Usage: python ML/service.py [--address /tmp/bte-inference.sock | 127.0.0.1:8765] [--max-batch 8]
+#                             [--max-wait-ms 10] [--backend pytorch]
+# Clients use it when BTE_INFERENCE_SERVICE is set to the same address, or after inference.set_service(address).
+#
+# Messages both ways are a 4 byte big-endian length followed by that much JSON:
+#   request   {"image": "/absolute/path.jpg", "use_cache": true}
+#   response  {"holds": [hold dicts]} or {"error": "..."}
+# Images go by path, so the service has to be able to read the client's files (same machine).
+import sys
+import os
+import json
+import socket
+import struct
+import asyncio
+import argparse
+import tempfile
+import threading
+import inference
+import instrument
+
+default_address = '127.0.0.1:8765' if os.name == 'nt' else os.path.join(tempfile.gettempdir(), 'bte-inference.sock')
+max_batch = 8  # Images per forward pass
+max_wait = 0.01  # Seconds the first request of a batch waits for others to join it
+
+
+def parse_address(address):
+    # 'host:port' is TCP, anything else a Unix socket path
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+def encode(message):
+    data = json.dumps(message).encode()
+    return struct.pack('>I', len(data)) + data
+
+
+async def read_message(reader):
+    size, = struct.unpack('>I', await reader.readexactly(4))
+    return json.loads(await reader.readexactly(size))
+
+
+def detect_batch(requests):
+    # Runs on a worker thread, one batched forward pass per cache setting. If the batch fails its
+    # images are retried one at a time, so a bad image only fails its own request.
+    # detect_holds_batch never goes through the client mode, so this can't end up calling the service.
+    responses = [None] * len(requests)
+    for use_cache in (True, False):
+        group = [i for i, request in enumerate(requests) if bool(request.get('use_cache', True)) == use_cache]
+        if not group:
+            continue
+        paths = [requests[i]['image'] for i in group]
+        try:
+            results = inference.detect_holds_batch(paths, batch_size=len(paths), workers=min(4, len(paths)),
+                                                   use_cache=use_cache)
+        except Exception:
+            results = [None] * len(paths)
+
+        for i, path, holds in zip(group, paths, results):
+            if holds is None:
+                try:
+                    holds = inference.detect_holds_batch([path], batch_size=1, workers=1, use_cache=use_cache)[0]
+                except Exception as e:
+                    responses[i] = {'error': f"{type(e).__name__}: {e}"}
+                    continue
+            responses[i] = {'holds': holds}
+    return responses
+
+
+class InferenceService:
+    def __init__(self, max_batch=max_batch, max_wait=max_wait):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = None
+
+    async def serve(self, address=default_address, ready=None):
+        # Runs until cancelled, ready (a threading.Event) is set once connections are accepted
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batcher())
+        target = parse_address(address)
+        if isinstance(target, tuple):
+            server = await asyncio.start_server(self._client, *target)
+        else:
+            if os.path.exists(target):
+                os.unlink(target)  # Left behind by a service that didn't shut down cleanly
+            server = await asyncio.start_unix_server(self._client, target)
+
+        try:
+            async with server:
+                if ready is not None:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if not isinstance(target, tuple) and os.path.exists(target):
+                os.unlink(target)
+
+    async def _client(self, reader, writer):
+        # A connection sends any number of requests, one at a time
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                future = loop.create_future()
+                await self.queue.put((request, future))
+                writer.write(encode(await future))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _batcher(self):
+        # Waits for a request, then up to max_wait for more to fill the batch, then runs the model
+        # off the event loop. Batches run one at a time, the model is never used by two threads.
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            instrument.count('service.batches')
+            instrument.count('service.images', len(batch))
+            with instrument.timer('service.batch'):
+                responses = await loop.run_in_executor(None, detect_batch, [request for request, _ in batch])
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+
+# Client side, used by inference.detect_holds in client mode. Each thread keeps its own connection open.
+_local = threading.local()
+
+
+def connect(address):
+    target = parse_address(address)
+    if isinstance(target, tuple):
+        return socket.create_connection(target)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(target)
+    return sock
+
+
+def receive(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Inference service closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+def exchange(sock, message):
+    sock.sendall(message)
+    size, = struct.unpack('>I', receive(sock, 4))
+    return json.loads(receive(sock, size))
+
+
+def request(address, image_path, use_cache=True):
+    # Hold dicts for one image from the service at address, raises RuntimeError if detection failed there
+    message = encode({'image': os.path.abspath(image_path), 'use_cache': use_cache})
+    connections = _local.__dict__.setdefault('connections', {})
+
+    sock = connections.pop(address, None)
+    response = None
+    if sock is not None:
+        try:
+            response = exchange(sock, message)
+        except OSError:
+            sock.close()  # The service restarted since this thread's last request, reconnect
+            sock = None
+    if sock is None:
+        sock = connect(address)
+        response = exchange(sock, message)
+    connections[address] = sock
+
+    if 'error' in response:
+        raise RuntimeError(f"Inference service: {response['error']}")
+    return response['holds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve detect_holds from one model to local clients")
+    parser.add_argument('--address', default=os.environ.get('BTE_INFERENCE_SERVICE') or default_address,
+                        help="Unix socket path or host:port")
+    parser.add_argument('--max-batch', type=int, default=max_batch)
+    parser.add_argument('--max-wait-ms', type=float, default=max_wait * 1000)
+    parser.add_argument('--backend', default=inference.backend, choices=inference.backends)
+    args = parser.parse_args()
+
+    # This process runs the model itself, even with BTE_INFERENCE_SERVICE set
+    inference.set_service(None)
+    inference.set_backend(args.backend)
+    inference.get_model(warmup=True)
+
+    print(f"Serving on {args.address}, batches of up to {args.max_batch}, waiting up to {args.max_wait_ms:g} ms",
+          file=sys.stderr)
+    try:
+        asyncio.run(InferenceService(args.max_batch, args.max_wait_ms / 1000).serve(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
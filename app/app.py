@@ -1,5 +1,7 @@
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 from PIL import Image, ImageTk
 import tkinter as tk
@@ -7,9 +9,14 @@ from tkinter import filedialog, messagebox, ttk
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
 import inference as inf 
+import instrument
+from imaging import ImageHandle
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
-import pathing
+from planner import WallPlanner, plan_all_colours, format_sweep
+from graph import NoRouteError, SearchCancelled
+import wallfile
+from state import SearchStats
 
 class ClimbingPathGUI:
     def __init__(self, root):
@@ -65,6 +72,24 @@ class ClimbingPathGUI:
             font=("Arial", 14)
         )
         self.submit_button.pack(side=tk.LEFT, padx=5)
+
+        # All Colours Button, plans every colour on the wall from one detection
+        self.all_colours_button = tk.Button(
+            self.class_frame,
+            text="All Colours",
+            command=self.plan_all_colours,
+            font=("Arial", 14)
+        )
+        self.all_colours_button.pack(side=tk.LEFT, padx=5)
+
+        # Save Wall Button, stores the detection so the photo never goes through the model again
+        self.save_wall_button = tk.Button(
+            self.class_frame,
+            text="Save Wall",
+            command=self.save_wall,
+            font=("Arial", 14)
+        )
+        self.save_wall_button.pack(side=tk.LEFT, padx=5)
         
         # User info Height and Foothold Frame
         self.user_frame = tk.Frame(self.controls_frame)
@@ -123,6 +148,15 @@ class ClimbingPathGUI:
         self.RF_label.pack(side=tk.LEFT, padx=5)
         self.RF_entry = tk.Entry(self.user_frame, width=3)
         self.RF_entry.pack(side=tk.LEFT, padx=5)
+
+        self.avoid_label = tk.Label(
+            self.user_frame,
+            text="Avoid",
+            font=("Arial, 12")
+        )
+        self.avoid_label.pack(side=tk.LEFT, padx=5)
+        self.avoid_entry = tk.Entry(self.user_frame, width=8)
+        self.avoid_entry.pack(side=tk.LEFT, padx=5)
         
         
         # Generate Steps Button
@@ -134,6 +168,56 @@ class ClimbingPathGUI:
         )
         self.upload_button.pack(side=tk.LEFT, padx=10)
 
+        # Alternatives Button, several betas from one search
+        self.alternatives_button = tk.Button(
+            self.controls_frame,
+            text="Alternatives",
+            command=self.generate_alternatives,
+            font=("Arial", 14)
+        )
+        self.alternatives_button.pack(side=tk.LEFT, padx=10)
+
+        # Height Sweep Button, the same problem for a range of climber heights
+        self.sweep_button = tk.Button(
+            self.controls_frame,
+            text="Height Sweep",
+            command=self.sweep_heights,
+            font=("Arial", 14)
+        )
+        self.sweep_button.pack(side=tk.LEFT, padx=10)
+
+        # Cancel Button, stops the running search
+        self.cancel_button = tk.Button(
+            self.controls_frame,
+            text="Cancel",
+            command=self.cancel_task,
+            font=("Arial", 14),
+            state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=10)
+
+        # Cheapest route toggle, searches with the admissible 'table' heuristic instead of the faster
+        # near-greedy default, see graph.heuristics. Alternatives are always ranked cheapest first.
+        self.cheapest = tk.BooleanVar(value=False)
+        self.cheapest_check = tk.Checkbutton(
+            self.controls_frame,
+            text="Cheapest",
+            variable=self.cheapest,
+            font=("Arial", 12)
+        )
+        self.cheapest_check.pack(side=tk.LEFT, padx=10)
+
+        # Stats toggle, times every stage and shows the totals under the steps
+        self.show_stats = tk.BooleanVar(value=instrument.enabled)
+        self.stats_check = tk.Checkbutton(
+            self.controls_frame,
+            text="Stats",
+            variable=self.show_stats,
+            command=self.toggle_stats,
+            font=("Arial", 12)
+        )
+        self.stats_check.pack(side=tk.LEFT, padx=10)
+
         # Frame for the image and text
         self.display_frame = tk.Frame(self.root)
         self.display_frame.pack(pady=20, fill=tk.BOTH, expand=True)
@@ -158,6 +242,26 @@ class ClimbingPathGUI:
         )
         self.text_label.pack(anchor=tk.NW)
 
+        # Progress of the running task
+        self.status_label = tk.Label(
+            self.text_frame,
+            text="",
+            font=("Arial", 12)
+        )
+        self.status_label.pack(anchor=tk.NW)
+
+        # Paging through alternative betas
+        self.page_frame = tk.Frame(self.text_frame)
+        self.page_frame.pack(anchor=tk.NW)
+        self.prev_button = tk.Button(self.page_frame, text="<", command=lambda: self.show_alternative(-1),
+                                     font=("Arial", 12), state=tk.DISABLED)
+        self.prev_button.pack(side=tk.LEFT)
+        self.page_label = tk.Label(self.page_frame, text="", font=("Arial", 12))
+        self.page_label.pack(side=tk.LEFT, padx=5)
+        self.next_button = tk.Button(self.page_frame, text=">", command=lambda: self.show_alternative(1),
+                                     font=("Arial", 12), state=tk.DISABLED)
+        self.next_button.pack(side=tk.LEFT)
+
         self.text_field = tk.Text(
             self.text_frame,
             wrap=tk.WORD,
@@ -165,53 +269,107 @@ class ClimbingPathGUI:
         )
         self.text_field.pack(fill=tk.BOTH, expand=True)
 
+        # Stats panel, only packed while Stats is ticked
+        self.stats_frame = tk.Frame(self.text_frame)
+        self.stats_label = tk.Label(
+            self.stats_frame,
+            text="",
+            font=("Courier", 10),
+            justify=tk.LEFT
+        )
+        self.stats_label.pack(anchor=tk.NW)
+        self.export_button = tk.Button(
+            self.stats_frame,
+            text="Export Trace",
+            command=self.export_trace,
+            font=("Arial", 12)
+        )
+        self.export_button.pack(anchor=tk.NW)
+        if instrument.enabled:
+            self.stats_frame.pack(fill=tk.X, pady=5)
+
         self.processed_photo_image = None
         self.processed_image_np = None
         self.image_path = None
+        self.image = None
+        self.wall = None
         self.holds = None
         self.target_class = None
+        self.planner = None
+        self.alternatives = []
+        self.alternative = 0
+
+        # Detection and search run on a worker thread so the window stays responsive
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task_id = 0
+        self.cancel_event = None
+        self.task_future = None
+        self.task_stats = None
 
     def upload_image(self):
         file_path = filedialog.askopenfilename(
             title="Select Image",
-            filetypes=[("Image Files", "*.jpg;*.jpeg;*.png;*.bmp;*.tiff")]
+            filetypes=[("Image Files", "*.jpg;*.jpeg;*.png;*.bmp;*.tiff"), ("Wall Files", "*.npz")]
         )
         if not file_path:
             messagebox.showinfo("Error!", f"{file_path} is not a file path")
+            return
+
+        # Whatever is still running was asked about the previous photo
+        self.cancel_task()
+        if wallfile.is_wall_file(file_path):
+            # Saved walls skip inference, the photo is only needed to draw on
+            self.image_path = file_path
+            self.wall = wallfile.load_wall(file_path)
+            source = self.wall.source_image
+            self.image = ImageHandle(source) if source and os.path.isfile(source) else None
         else:
             self.image_path = file_path
+            self.wall = None
+            self.image = ImageHandle(file_path)  # Decoded on first use, then shared
 
     def submit_image(self):
         if not self.image_path:
             messagebox.showerror("Error", "No image uploaded. Please upload an image first.")
             return
 
-        self.target_class = self.class_dropdown.get()
+        image = self.image
+        wall = self.wall
+        target_class = self.class_dropdown.get()
 
-        try:
-            processed_image = inf.generate_image(self.image_path, self.target_class)
-            if processed_image is not None:
-                self.processed_image_np = processed_image
-                
-                processed_image_rgb = cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(processed_image_rgb)
-                pil_image = self.resize_image_with_aspect_ratio(pil_image, 800, 750)
-                self.processed_photo_image = ImageTk.PhotoImage(pil_image)
-
-                self.processed_canvas.delete("all")
-                self.processed_canvas.create_image(400, 375, image=self.processed_photo_image, anchor=tk.CENTER)
-                self.holds = inf.filter_holds(inf.detect_holds(self.image_path), self.target_class)
+        def work(cancel):
+            if wall is not None:
+                planner = wall.planner(target_class)
+                holds = planner.holds
             else:
-                messagebox.showerror("Error", "Failed to process the image.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred:\n{e}")
+                # Detection results are cached, so switching colour on the same photo doesn't rerun the model
+                holds = inf.filter_holds(inf.detect_holds(image), target_class)
+                planner = None
+            if image is None:
+                return holds, planner, None
+            # Annotations go on a canvas-sized copy, not the full resolution photo
+            return holds, planner, inf.draw_holds(image, holds, max_size=(800, 750))
+
+        self.run_task("Detecting holds...", work, lambda result: self.show_holds(target_class, image, *result))
+
+    def show_holds(self, target_class, image, holds, planner, processed_image):
+        self.target_class = target_class
+        self.holds = holds
+        self.planner = planner
+        if image is None:
+            self.processed_canvas.delete("all")  # Wall file without its photo
+        elif processed_image is not None:
+            self.processed_image_np = processed_image
+            
+            processed_image_rgb = cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB)
+            pil_image = Image.fromarray(processed_image_rgb)
+            self.processed_photo_image = ImageTk.PhotoImage(pil_image)
+
+            self.processed_canvas.delete("all")
+            self.processed_canvas.create_image(400, 375, image=self.processed_photo_image, anchor=tk.CENTER)
+        else:
+            messagebox.showerror("Error", "Failed to process the image.")
 
-    def resize_image_with_aspect_ratio(self, pil_image, max_width, max_height):
-        original_width, original_height = pil_image.size
-        ratio = min(max_width / original_width, max_height / original_height)
-        new_size = (int(original_width * ratio), int(original_height * ratio))
-        return pil_image.resize(new_size)
-    
     def generate_steps(self):
         start_state = {
             "right_hand": int(self.RH_entry.get()),
@@ -219,9 +377,26 @@ class ClimbingPathGUI:
             "right_foot": int(self.RF_entry.get()),
             "left_foot": int(self.LF_entry.get())
         }
-        
-        steps = pathing.path(self.holds, self.height_entry.get(), self.foot_id_entry.get(), self.target_class, start_state)
-        
+        user_height = self.height_entry.get()
+        foot_holds = self.foot_id_entry.get()
+        holds, target_class, planner = self.holds, self.target_class, self.planner
+        heuristic = self.heuristic()
+        stats = SearchStats()
+
+        def work(cancel):
+            # The planner keeps the per-wall work between clicks, it is rebuilt when a new problem is submitted
+            wall_planner = planner or WallPlanner(holds, target_class)
+            return wall_planner, wall_planner.plan(user_height, foot_holds, start_state, stats=stats, cancel=cancel,
+                                                   heuristic=heuristic)
+
+        self.run_task("Searching...", work, lambda result: self.show_steps(*result), stats)
+
+    def show_steps(self, planner, steps):
+        self.planner = planner
+        self.alternatives = []
+        self.page_label.config(text="")
+        self.prev_button.config(state=tk.DISABLED)
+        self.next_button.config(state=tk.DISABLED)
         if steps:
             self.text_field.delete("1.0", tk.END)  
             count = 0
@@ -235,10 +410,202 @@ class ClimbingPathGUI:
             self.text_field.delete("1.0", tk.END)
             self.text_field.insert(tk.END, "Unable to determine steps")
 
+    def generate_alternatives(self, k=5):
+        start_state = {
+            "right_hand": int(self.RH_entry.get()),
+            "left_hand": int(self.LH_entry.get()),
+            "right_foot": int(self.RF_entry.get()),
+            "left_foot": int(self.LF_entry.get())
+        }
+        user_height = self.height_entry.get()
+        foot_holds = self.foot_id_entry.get()
+        avoid_holds = self.avoid_entry.get()
+        holds, target_class, planner = self.holds, self.target_class, self.planner
+        stats = SearchStats()
+
+        def work(cancel):
+            wall_planner = planner or WallPlanner(holds, target_class)
+            return wall_planner, wall_planner.plan_alternatives(k, user_height, foot_holds, start_state, avoid_holds,
+                                                                stats=stats, cancel=cancel)
+
+        self.run_task("Searching for alternatives...", work, lambda result: self.show_alternatives(*result), stats)
+
+    def show_alternatives(self, planner, alternatives):
+        # All alternatives come back at once, paging only redraws
+        self.planner = planner
+        self.alternatives = alternatives
+        self.alternative = 0
+        self.show_alternative(0)
+
+    def show_alternative(self, offset):
+        self.alternative = max(0, min(len(self.alternatives) - 1, self.alternative + offset))
+        cost, steps = self.alternatives[self.alternative]
+        self.page_label.config(text=f"Beta {self.alternative + 1} of {len(self.alternatives)}, cost {cost}")
+        self.prev_button.config(state=tk.NORMAL if self.alternative > 0 else tk.DISABLED)
+        self.next_button.config(state=tk.NORMAL if self.alternative < len(self.alternatives) - 1 else tk.DISABLED)
+
+        self.text_field.delete("1.0", tk.END)
+        for count, step in enumerate(steps):
+            self.text_field.insert(tk.END, 'Step ' + str(count) + ': ' + step + '\n')
+
+    def sweep_heights(self, heights=range(150, 201, 5)):
+        start_state = {
+            "right_hand": int(self.RH_entry.get()),
+            "left_hand": int(self.LH_entry.get()),
+            "right_foot": int(self.RF_entry.get()),
+            "left_foot": int(self.LF_entry.get())
+        }
+        foot_holds = self.foot_id_entry.get()
+        holds, target_class, planner = self.holds, self.target_class, self.planner
+        heuristic = self.heuristic()
+
+        def work(cancel):
+            wall_planner = planner or WallPlanner(holds, target_class)
+            return wall_planner, wall_planner.sweep(heights, foot_holds, start_state, cancel=cancel,
+                                                    heuristic=heuristic)
+
+        self.run_task("Planning for every height...", work, lambda result: self.show_sweep(*result))
+
+    def show_sweep(self, planner, rows):
+        self.planner = planner
+        self.text_field.delete("1.0", tk.END)
+        self.text_field.insert(tk.END, format_sweep(rows) + '\n')
+
+    def plan_all_colours(self):
+        if not self.image_path:
+            messagebox.showerror("Error", "No image uploaded. Please upload an image first.")
+            return
+
+        image = self.image
+        wall = self.wall
+        user_height = self.height_entry.get()
+        heuristic = self.heuristic()
+
+        def work(cancel):
+            # Each colour starts from its two lowest holds for feet and the next two for hands
+            holds = wall.holds if wall is not None else inf.detect_holds(image, columnar=True)
+            return plan_all_colours(holds, user_height, cancel=cancel, heuristic=heuristic)
+
+        self.run_task("Planning all colours...", work, self.show_all_colours)
+
+    def show_all_colours(self, results):
+        self.text_field.delete("1.0", tk.END)
+        for colour, result in results.items():
+            self.text_field.insert(tk.END, f"{colour} ({result['holds']} holds, {result['seconds']:.2f}s): ")
+            if result['status'] == 'ok':
+                self.text_field.insert(tk.END, f"{len(result['steps'])} steps\n")
+                for count, step in enumerate(result['steps']):
+                    self.text_field.insert(tk.END, 'Step ' + str(count) + ': ' + step + '\n')
+            else:
+                self.text_field.insert(tk.END, f"{result['reason']}\n")
+            self.text_field.insert(tk.END, '\n')
+
+    def save_wall(self):
+        if not self.image_path or self.wall is not None:
+            messagebox.showerror("Error", "Upload a photo to save its wall.")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Save Wall",
+            defaultextension=".npz",
+            filetypes=[("Wall Files", "*.npz")]
+        )
+        if not path:
+            return
+
+        image = self.image
+
+        def work(cancel):
+            holds = inf.detect_holds(image, columnar=True)
+            return wallfile.save_wall(path, holds, source_image=os.path.abspath(image.path), source_hash=image.content_hash)
+
+        self.run_task("Saving wall...", work, lambda wall: self.status_label.config(text=f"Saved {path}"))
+
+    def toggle_stats(self):
+        instrument.enable(self.show_stats.get())
+        if self.show_stats.get():
+            self.stats_frame.pack(fill=tk.X, pady=5)
+            self.update_stats()
+        else:
+            self.stats_frame.pack_forget()
+
+    def update_stats(self):
+        if self.show_stats.get():
+            self.stats_label.config(text=instrument.summary())
+
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(
+            title="Export Trace",
+            defaultextension=".json",
+            filetypes=[("Chrome Trace", "*.json")]
+        )
+        if path:
+            instrument.export_chrome_trace(path)
+
+    def heuristic(self):
+        return 'table' if self.cheapest.get() else 'euclidean'
+
+    def run_task(self, status, work, on_done, stats=None):
+        # Runs work(cancel_event) on the worker thread and hands its result to on_done on the Tk thread.
+        # A new task cancels the running one, and results of superseded tasks are dropped.
+        self.cancel_task()
+        self.task_id += 1
+        self.cancel_event = threading.Event()
+        self.task_stats = stats
+        future = self.task_future = self.executor.submit(work, self.cancel_event)
+
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status_label.config(text=status)
+        self.root.after(50, self.poll_task, self.task_id, future, status, on_done)
+
+    def poll_task(self, task_id, future, status, on_done):
+        if task_id != self.task_id:
+            return  # A newer request replaced this one
+
+        if not future.done():
+            if self.task_stats is not None:
+                self.status_label.config(text=f"{status} {self.task_stats.expansions} expansions")
+            self.root.after(50, self.poll_task, task_id, future, status, on_done)
+            return
+
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_label.config(text="")
+        self.update_stats()
+        try:
+            result = future.result()
+        except SearchCancelled:
+            self.status_label.config(text="Cancelled")
+            return
+        except NoRouteError as e:
+            self.text_field.delete("1.0", tk.END)
+            self.text_field.insert(tk.END, f"Unable to determine steps:\n{e.reason}")
+            return
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred:\n{e}")
+            return
+        on_done(result)
+
+    def cancel_task(self):
+        # Searches stop at their next expansion, detection can't be interrupted but its result is dropped.
+        # A task that has finished but not been shown yet is dropped too.
+        if self.task_future is None:
+            return
+        self.task_id += 1
+        self.cancel_button.config(state=tk.DISABLED)
+        if not self.task_future.done():
+            self.cancel_event.set()
+            self.status_label.config(text="Cancelled")
+
+    def close(self):
+        # Closing the window stops a running search instead of waiting for it
+        self.cancel_task()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
 
 def main():
     root = tk.Tk()
     app = ClimbingPathGUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.close)
     root.mainloop()
 
 if __name__ == "__main__":
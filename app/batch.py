@@ -0,0 +1,188 @@
+# Headless batch planning: detection + pathing for a manifest of problems, results streamed as JSONL
+# Usage: python app/batch.py IMAGE_DIR MANIFEST [--output betas.jsonl] [--workers 4] [--time-budget S]
+#
+# The manifest is a JSON list (or {"problems": [...]}) or a CSV file, one problem per row:
+#   image, colour, height, footholds, right_hand, left_hand, right_foot, left_foot[, id]
+# footholds is a space separated string of ids (a JSON list works too), JSON rows may give the
+# hands and feet as a "start_state" dict instead. Problems without an id get one from their contents.
+#
+# image may also be a wall file (.npz, see pathing/wallfile.py), which skips inference. With
+# --wall-dir, every photo's detection is saved there as a wall file named after the photo's content
+# hash, and reused on later runs as long as the photo hasn't changed.
+#
+# Every problem that already has a result in the output file is skipped, so an interrupted run
+# picks up where it stopped when started again with the same arguments. Errors are retried.
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference as inf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+from graph import NoRouteError, heuristics
+import wallfile
+
+LIMBS = ('right_hand', 'left_hand', 'right_foot', 'left_foot')
+
+
+def load_manifest(path):
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows['problems']
+
+    problems = []
+    for row in rows:
+        start_state = row.get('start_state') or {limb: row[limb] for limb in LIMBS}
+        start_state = {limb: int(start_state[limb]) for limb in LIMBS}
+        footholds = row['footholds']
+        if not isinstance(footholds, str):
+            footholds = ' '.join(str(x) for x in footholds)
+        problem = {
+            'image': row['image'],
+            'colour': row['colour'],
+            'height': int(row['height']),
+            'footholds': ' '.join(footholds.split()),
+            'start_state': start_state,
+        }
+        problem['id'] = str(row.get('id') or problem_id(problem))
+        problems.append(problem)
+    return problems
+
+
+def problem_id(problem):
+    start = ' '.join(str(problem['start_state'][limb]) for limb in LIMBS)
+    return f"{problem['image']}|{problem['colour']}|{problem['height']}|{problem['footholds']}|{start}"
+
+
+def finished_ids(output_path):
+    # Ids with a final answer in the output file. A line cut off by an interruption is dropped
+    # so appending starts on a fresh line.
+    if not os.path.isfile(output_path):
+        return set()
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+
+    done = set()
+    for line in data.decode().splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if result.get('status') in ('ok', 'no_route'):
+            done.add(result['id'])
+    return done
+
+
+def init_worker(backend):
+    # Each worker loads its model the first time it has a photo to detect, so a run over wall files
+    # and --wall-dir hits never needs torch or the weights
+    inf.set_backend(backend)
+
+
+def load_or_detect(image_path, wall_dir=None):
+    if wallfile.is_wall_file(image_path):
+        return wallfile.load_wall(image_path)
+    if wall_dir is None:
+        return wallfile.Wall(inf.detect_holds(image_path, columnar=True))
+
+    # Named after the photo's contents, so photos that share a file name don't share a detection
+    # and a replaced photo is detected again. Files in an older format are replaced too.
+    source_hash = inf.file_hash(image_path)
+    wall_path = os.path.join(wall_dir, source_hash + '.npz')
+    if os.path.isfile(wall_path) and wallfile.file_version(wall_path) == wallfile.version:
+        wall = wallfile.load_wall(wall_path)
+        if wall.source_hash == source_hash:
+            return wall
+
+    holds = inf.detect_holds(image_path, columnar=True)
+    return wallfile.save_wall(wall_path, holds, source_image=os.path.abspath(image_path), source_hash=source_hash)
+
+
+def solve_image(image_path, problems, time_budget=None, max_expansions=None, wall_dir=None, heuristic='euclidean'):
+    # All problems on one photo share a worker, so the photo goes through the model once
+    # and each colour's per-wall work is built once
+    results = []
+    try:
+        start = time.perf_counter()
+        wall = load_or_detect(image_path, wall_dir)
+        detect_seconds = time.perf_counter() - start
+    except Exception as e:
+        return [dict(problem, status='error', reason=f"Detection failed: {e}") for problem in problems]
+
+    for problem in problems:
+        result = dict(problem, detect_seconds=round(detect_seconds, 4))
+        start = time.perf_counter()
+        try:
+            planner = wall.planner(problem['colour'])
+            result['steps'] = planner.plan(problem['height'], problem['footholds'], problem['start_state'],
+                                           time_budget, max_expansions, heuristic=heuristic)
+            result['status'] = 'ok'
+        except NoRouteError as e:
+            result['status'] = 'no_route'
+            result['reason'] = e.reason
+        except Exception as e:
+            result['status'] = 'error'
+            result['reason'] = f"{type(e).__name__}: {e}"
+        result['plan_seconds'] = round(time.perf_counter() - start, 4)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute betas for every problem in a manifest")
+    parser.add_argument('image_dir')
+    parser.add_argument('manifest')
+    parser.add_argument('--output', default='betas.jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--backend', default=inf.backend, choices=inf.backends)
+    parser.add_argument('--time-budget', type=float, default=None, help="Seconds per search, best route so far")
+    parser.add_argument('--max-expansions', type=int, default=None)
+    parser.add_argument('--heuristic', default='euclidean', choices=heuristics,
+                        help="'table' finds cheapest routes at more expansions, see pathing/graph.py")
+    parser.add_argument('--wall-dir', default=None, help="Save detections as wall files here and reuse them")
+    args = parser.parse_args()
+
+    problems = load_manifest(args.manifest)
+    done = finished_ids(args.output)
+    todo = {}
+    for problem in problems:
+        if problem['id'] not in done:
+            todo.setdefault(problem['image'], []).append(problem)
+    print(f"{len(problems)} problems, {len(done)} already done, {sum(map(len, todo.values()))} to run "
+          f"on {len(todo)} images", file=sys.stderr)
+    if not todo:
+        return
+
+    if args.wall_dir:
+        os.makedirs(args.wall_dir, exist_ok=True)
+    counts = {}
+    with open(args.output, 'a') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.backend,)) as pool:
+        futures = [pool.submit(solve_image, os.path.join(args.image_dir, image), image_problems,
+                               args.time_budget, args.max_expansions, args.wall_dir, args.heuristic)
+                   for image, image_problems in todo.items()]
+        for future in as_completed(futures):
+            for result in future.result():
+                # Written and flushed per result, so nothing finished is lost if the run is killed
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    print(', '.join(f"{count} {status}" for status, count in sorted(counts.items())), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
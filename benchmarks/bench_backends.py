@@ -0,0 +1,50 @@
+# Latency and detection agreement of each inference backend against the eager PyTorch baseline
+# Usage: python benchmarks/bench_backends.py IMAGE_DIR [--backends pytorch torchscript onnx onnx-int8]
+import sys
+import os
+import time
+import argparse
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference
+from imaging import ImageHandle
+from postprocess import compare_holds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_dir')
+    parser.add_argument('--backends', nargs='+', default=list(inference.backends))
+    parser.add_argument('--iou', type=float, default=0.5, help="IoU needed to pair two boxes")
+    args = parser.parse_args()
+
+    exts = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    paths = sorted(os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir) if f.lower().endswith(exts))
+    assert paths, f"No images in {args.image_dir}"
+    images = [ImageHandle(path) for path in paths]
+    for image in images:
+        image.image  # Decode up front so it isn't timed
+
+    baseline = None
+    print(f"{len(images)} images")
+    print(f"{'backend':<12} {'ms/img':>8} {'recall':>7} {'precision':>9} {'mean IoU':>8} {'class':>6}")
+    for name in ['pytorch'] + [b for b in args.backends if b != 'pytorch']:
+        inference.set_backend(name)
+        inference.get_model(warmup=True)
+
+        results, times = [], []
+        for image in images:
+            start = time.perf_counter()
+            results.append(inference.detect_holds(image, use_cache=False, columnar=True))
+            times.append(time.perf_counter() - start)
+        baseline = baseline or results
+
+        agreement = [compare_holds(ref, res, args.iou) for ref, res in zip(baseline, results)]
+        mean = lambda key: statistics.mean(a[key] for a in agreement)
+        print(f"{name:<12} {statistics.median(times) * 1000:>8.1f} {mean('recall'):>7.3f} {mean('precision'):>9.3f} "
+              f"{mean('mean_iou'):>8.3f} {mean('class_agreement'):>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
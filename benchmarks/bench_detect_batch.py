@@ -0,0 +1,35 @@
+# CPU throughput of detect_holds_batch for a few batch sizes, detection cache off
+# Usage: python benchmarks/bench_detect_batch.py IMAGE_DIR [--batch-sizes 1 2 4 8] [--workers 4]
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_dir')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    exts = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    paths = sorted(os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir) if f.lower().endswith(exts))
+    assert paths, f"No images in {args.image_dir}"
+
+    inference.get_model(warmup=True)
+    baseline = None
+    print(f"{len(paths)} images")
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        inference.detect_holds_batch(paths, batch_size=batch_size, workers=args.workers, use_cache=False)
+        rate = len(paths) / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"batch {batch_size:>3}: {rate:6.2f} images/s ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
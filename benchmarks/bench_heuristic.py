@@ -0,0 +1,107 @@
+# Expansions, route cost and time of a_star with the Euclidean heuristic (a_star's default, near-greedy) and
+# the precomputed 'table' heuristic, at weight 1 (optimal, opt-in) and weighted 3x
+# Usage: python benchmarks/bench_heuristic.py [--holds 20 50 100 200 500] [--seeds 0 1 2 3 4]
+#                                            [--walls WALL.npz|IMAGE ...] [--ucs]
+# Real walls are wall files (see pathing/wallfile.py) or photos, which go through detection first.
+# Every colour with at least 4 holds is planned from WallPlanner.default_start.
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+import graph
+import synthetic
+import wallfile
+from planner import WallPlanner
+from state import SearchStats, pack_state
+
+# (label, heuristic, weight)
+variants = (
+    ('euclidean', 'euclidean', 1.0),
+    ('table x3', 'table', 3.0),
+    ('table', 'table', 1.0),
+)
+
+
+def run(planner, height, variants, max_expansions):
+    start_state, foot_holds = planner.default_start()
+    foot_hold_ids = [int(x) for x in foot_holds.split()]
+    start_state = pack_state(start_state)
+    climber = planner.climber(height)
+    graph.precheck(planner.index, climber, start_state, planner.goal_node_id, foot_hold_ids)
+
+    results = []
+    for label, heuristic, weight in variants:
+        # Table building is per wall work, kept out of the timing like the reach tables
+        graph.goal_move_tables(planner.index, climber, planner.index.position[planner.goal_node_id],
+                               planner.index.mask(foot_hold_ids))
+        stats = SearchStats()
+        start = time.perf_counter()
+        goal, _ = graph.weighted_a_star(planner.index, climber, start_state, planner.goal_node_id, foot_hold_ids,
+                                        weight, max_expansions=max_expansions, stats=stats, heuristic=heuristic)
+        results.append((label, stats.expansions, goal.g if goal else None, time.perf_counter() - start))
+    return results
+
+
+def walls(args):
+    for n_holds in args.holds:
+        for seed in args.seeds:
+            holds = synthetic.generate_wall(n_holds, seed, args.density, synthetic.wall_aspect(n_holds, args.density))
+            yield f"synthetic {n_holds}/{seed}", WallPlanner(holds, 'Pink')
+    for path in args.walls:
+        if wallfile.is_wall_file(path):
+            wall = wallfile.load_wall(path)
+        else:
+            sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+            import inference
+            wall = wallfile.Wall(inference.detect_holds(path, columnar=True))
+        for colour in wall.colours():
+            if len(wall.holds.of_class(colour)) >= 4:
+                yield f"{os.path.basename(path)} {colour}", wall.planner(colour)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--holds', type=int, nargs='*', default=[20, 50, 100, 200, 500])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    parser.add_argument('--density', type=float, default=6.0)
+    parser.add_argument('--walls', nargs='*', default=[])
+    parser.add_argument('--height', type=int, default=170)
+    parser.add_argument('--ucs', action='store_true', help="Also run uniform cost search, the optimal baseline")
+    parser.add_argument('--max-expansions', type=int, default=500000)
+    args = parser.parse_args()
+
+    runs = variants + ((('uniform cost', 'euclidean', 0.0),) if args.ucs else ())
+    totals = {label: [0, 0, 0.0] for label, _, _ in runs}
+    ratios = {label: [] for label, _, _ in runs}  # Per wall expansions against euclidean
+    print(f"{'wall':<28}" + ''.join(f"{label:>26}" for label, _, _ in runs))
+    print(f"{'':<28}" + f"{'expansions  cost      ms':>26}" * len(runs))
+    for name, planner in walls(args):
+        try:
+            results = run(planner, args.height, runs, args.max_expansions)
+        except graph.NoRouteError:
+            continue
+        line = f"{name:<28}"
+        solved = all(cost is not None for _, _, cost, _ in results)
+        for label, expansions, cost, seconds in results:
+            ratios[label].append(expansions / results[0][1])
+            line += f"{expansions:>12} {str(cost):>5} {seconds * 1000:>7.1f}"
+            totals[label][0] += expansions
+            totals[label][1] += cost if solved else 0  # Costs only compare on walls every variant solved
+            totals[label][2] += seconds
+        print(line)
+
+    base = totals['euclidean'][0]
+    print()
+    for label, (expansions, cost, seconds) in totals.items():
+        median = sorted(ratios[label])[len(ratios[label]) // 2] if ratios[label] else float('nan')
+        print(f"{label:<14} {expansions:>10} expansions ({expansions / base:.2f}x euclidean, median wall "
+              f"{median:.2f}x), total cost {cost}, {seconds:.2f}s")
+    if base and totals['table'][0] > base:
+        print(f"\nThe optimal 'table' search expands {totals['table'][0] / base:.1f}x as much as the default "
+              f"'euclidean' one, in exchange for the cheapest routes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# Startup time of `import pathing` (and optionally `import inference`) in a fresh interpreter
+# Usage: python benchmarks/bench_import.py [--module pathing] [--repeat 5]
+import sys
+import os
+import argparse
+import statistics
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+child = """
+import sys, time
+sys.path.append({ml!r})
+sys.path.append({pathing!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, 'torch' in sys.modules)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='pathing')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    code = child.format(ml=os.path.join(root, 'ML'), pathing=os.path.join(root, 'pathing'), module=args.module)
+    times = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=root)
+        elapsed, torch_loaded = out.stdout.split()
+        times.append(float(elapsed))
+
+    print(f"import {args.module}: median {statistics.median(times) * 1000:.1f} ms, "
+          f"min {min(times) * 1000:.1f} ms over {args.repeat} runs, torch loaded: {torch_loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Peak RSS and nodes/sec of the planner on deep (20+ move) ladder routes
+# Usage: python benchmarks/bench_memory.py [--rungs 10 12 14 16]
+import sys
+import os
+import json
+import time
+import random
+import resource
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+
+
+def ladder_wall(rungs, spacing=60.0, seed=0):
+    # Two columns of holds plus a pair of footholds at the bottom, ids bottom to top
+    rng = random.Random(seed)
+    holds = []
+    base_y = 200.0 + rungs * spacing
+    holds.append({'center': [100.0, base_y + 80]})
+    holds.append({'center': [160.0, base_y + 80]})
+    for rung in range(rungs):
+        y = base_y - rung * spacing
+        holds.append({'center': [100.0 + rng.uniform(-5, 5), y]})
+        holds.append({'center': [160.0 + rng.uniform(-5, 5), y - spacing / 2]})
+    holds.append({'center': [130.0, base_y - rungs * spacing - 20]})
+
+    holds.sort(key=lambda hold: hold['center'][1], reverse=True)
+    for idx, hold in enumerate(holds):
+        x, y = hold['center']
+        hold.update({'id': idx + 1, 'class': 'Pink', 'confidence': 1.0, 'box': [x - 15, y - 15, x + 15, y + 15]})
+    return holds
+
+
+def run_child(rungs):
+    import graph
+    import agent
+    from hold_index import HoldIndex
+
+    holds = ladder_wall(rungs)
+    index = HoldIndex(holds)
+    start_state = {"right_hand": 4, "left_hand": 3, "right_foot": 2, "left_foot": 1}
+    climber = agent.climber(160.0)
+
+    expansions = 0
+    generate_next_states = graph.generate_next_states
+
+    def counting_generate_next_states(*args, **kwargs):
+        nonlocal expansions
+        expansions += 1
+        return generate_next_states(*args, **kwargs)
+
+    graph.generate_next_states = counting_generate_next_states
+
+    start = time.perf_counter()
+    steps = graph.find_path(index, climber, [1, 2], start_state)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'rungs': rungs,
+        'holds': len(holds),
+        'moves': len(steps) - 1,
+        'expansions': expansions,
+        'seconds': elapsed,
+        'nodes_per_sec': expansions / elapsed if elapsed else float('inf'),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rungs', type=int, nargs='+', default=[10, 12, 14, 16])
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args.child)))
+        return
+
+    # One process per run so peak RSS is not shared between runs
+    print(f"{'rungs':>6} {'holds':>6} {'moves':>6} {'expansions':>11} {'sec':>8} {'nodes/s':>10} {'peak MB':>8}")
+    for rungs in args.rungs:
+        out = subprocess.run([sys.executable, __file__, '--child', str(rungs)],
+                             capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout)
+        print(f"{r['rungs']:>6} {r['holds']:>6} {r['moves']:>6} {r['expansions']:>11} "
+              f"{r['seconds']:>8.3f} {r['nodes_per_sec']:>10.0f} {r['peak_rss_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Planner regression benchmark on seeded synthetic walls: time, expansions, peak frontier and peak memory
+# of graph.find_path for 20-500 holds. Results can be saved as JSON and compared against a saved baseline.
+# Usage: python benchmarks/bench_planner.py [--holds 20 50 100 200 500] [--seeds 0 1 2 3 4]
+#                                          [--save results.json] [--baseline baseline.json]
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+import graph
+import synthetic
+from planner import WallPlanner
+from state import SearchStats
+
+
+def run_case(n_holds, seed, density, height, repeat, heuristic, weight):
+    holds = synthetic.generate_wall(n_holds, seed, density, synthetic.wall_aspect(n_holds, density))
+    planner = WallPlanner(holds, 'Pink')
+    start_state, foot_holds = planner.default_start()
+    foot_hold_ids = [int(x) for x in foot_holds.split()]
+    climber = planner.climber(height)
+    planner.index.reach(climber)  # Per-wall work, not part of the search
+
+    def search():
+        stats = SearchStats()
+        try:
+            steps = graph.find_path(planner.index, climber, foot_hold_ids, start_state, stats=stats,
+                                    heuristic=heuristic, weight=weight)
+        except graph.NoRouteError:
+            steps = None
+        return steps, stats
+
+    search()  # Warm-up
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        steps, stats = search()
+        seconds.append(time.perf_counter() - start)
+
+    # Separate run for memory, tracemalloc slows everything down
+    tracemalloc.start()
+    search()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'case': f"{n_holds}/{seed}",
+        'holds': n_holds,
+        'seed': seed,
+        'solved': steps is not None,
+        'moves': len(steps) - 1 if steps else None,
+        'cost': stats.cost,
+        'seconds': min(seconds),
+        'expansions': stats.expansions,
+        'peak_frontier': stats.peak_frontier,
+        'peak_kb': peak / 1024,
+    }
+
+
+def compare(results, baseline, tolerance, noise):
+    # Slower than tolerance x baseline (and by more than noise seconds), more expansions or a different
+    # answer count as regressions
+    old = {case['case']: case for case in baseline['cases']}
+    regressions = 0
+    print(f"\n{'case':>8} {'time':>8} {'expansions':>16} {'peak kB':>16}")
+    for case in results['cases']:
+        base = old.get(case['case'])
+        if base is None:
+            continue
+        ratio = case['seconds'] / base['seconds'] if base['seconds'] else 1.0
+        flags = []
+        if ratio > tolerance and case['seconds'] - base['seconds'] > noise:
+            flags.append('slower')
+        if case['expansions'] > base['expansions']:
+            flags.append('more expansions')
+        if case['solved'] != base['solved'] or case['cost'] != base['cost']:
+            flags.append('different answer')
+        regressions += bool(flags)
+        print(f"{case['case']:>8} {ratio:>7.2f}x {base['expansions']:>7} -> {case['expansions']:<7}"
+              f"{base['peak_kb']:>7.0f} -> {case['peak_kb']:<7.0f} {', '.join(flags)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--holds', type=int, nargs='+', default=[20, 50, 100, 200, 500])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    parser.add_argument('--density', type=float, default=6.0, help="Holds per square metre")
+    parser.add_argument('--height', type=int, default=170, help="Climber height in cm")
+    parser.add_argument('--heuristic', default='euclidean', choices=graph.heuristics)
+    parser.add_argument('--weight', type=float, default=1.0, help="Heuristic weight, 1 is optimal with the table")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case, the fastest is kept")
+    parser.add_argument('--save', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against results saved with --save")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="Allowed slowdown against the baseline")
+    parser.add_argument('--noise', type=float, default=0.002, help="Slowdowns under this many seconds are ignored")
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'heuristic': args.heuristic,
+        'weight': args.weight,
+        'density': args.density,
+        'height': args.height,
+        'cases': [],
+    }
+    print(f"{'case':>8} {'solved':>7} {'moves':>6} {'expansions':>11} {'frontier':>9} {'ms':>9} {'peak kB':>8}")
+    for n_holds in args.holds:
+        for seed in args.seeds:
+            r = run_case(n_holds, seed, args.density, args.height, args.repeat, args.heuristic, args.weight)
+            results['cases'].append(r)
+            print(f"{r['case']:>8} {str(r['solved']):>7} {str(r['moves']):>6} {r['expansions']:>11} "
+                  f"{r['peak_frontier']:>9} {r['seconds'] * 1000:>9.2f} {r['peak_kb']:>8.0f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.noise)
+        print(f"\n{regressions} regressions")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Throughput and latency of the inference service (ML/service.py) under N concurrent clients, against
+# detect_holds run in this process one image at a time. Detection cache off throughout.
+# The service is started as a subprocess with the given batching settings, clients are threads.
+# Usage: python benchmarks/bench_service.py IMAGE_DIR [--clients 1 2 4 8] [--requests 8] [--max-batch 8]
+#                                          [--max-wait-ms 10] [--no-baseline]
+import sys
+import os
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference
+import service
+
+
+def start_service(address, max_batch, max_wait_ms, timeout=300):
+    # Waits until the service accepts connections, the model loads first
+    script = os.path.join(os.path.dirname(__file__), '../ML/service.py')
+    process = subprocess.Popen([sys.executable, script, '--address', address, '--max-batch', str(max_batch),
+                                '--max-wait-ms', str(max_wait_ms)])
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        assert process.poll() is None, "Inference service exited during startup"
+        try:
+            service.connect(address).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise TimeoutError(f"Inference service not up after {timeout}s")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_clients(paths, n_clients, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        for i in range(requests):
+            start = time.perf_counter()
+            inference.detect_holds(paths[(offset + i) % len(paths)], use_cache=False)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def report(name, seconds, latencies):
+    print(f"{name:>12} {len(latencies) / seconds:>9.2f} {percentile(latencies, 0.5) * 1000:>9.1f} "
+          f"{percentile(latencies, 0.95) * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_dir')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=8, help="Images per client")
+    parser.add_argument('--max-batch', type=int, default=service.max_batch)
+    parser.add_argument('--max-wait-ms', type=float, default=service.max_wait * 1000)
+    parser.add_argument('--address', default=os.path.join(tempfile.gettempdir(), f"bte-bench-{os.getpid()}.sock"))
+    parser.add_argument('--no-baseline', action='store_true', help="Skip loading a model in this process")
+    args = parser.parse_args()
+
+    exts = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    paths = sorted(os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir) if f.lower().endswith(exts))
+    assert paths, f"No images in {args.image_dir}"
+
+    print(f"{len(paths)} images, batches of up to {args.max_batch}, waiting up to {args.max_wait_ms:g} ms")
+    print(f"{'':>12} {'images/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    if not args.no_baseline:
+        inference.set_service(None)
+        inference.get_model(warmup=True)
+        report('in process', *run_clients(paths, 1, args.requests))
+
+    process = start_service(args.address, args.max_batch, args.max_wait_ms)
+    try:
+        inference.set_service(args.address)
+        run_clients(paths, 1, 1)  # Warm-up
+        for n_clients in args.clients:
+            report(f"{n_clients} clients", *run_clients(paths, n_clients, args.requests))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
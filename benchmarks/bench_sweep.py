@@ -0,0 +1,65 @@
+# Height sweep benchmark on seeded synthetic walls: pathing.path once per height (a fresh planner each time)
+# against WallPlanner.sweep, serially and over a process pool. Also prints the last wall's sweep table.
+# Usage: python benchmarks/bench_sweep.py [--holds 100 300] [--seeds 0 1 2] [--heights 150 200 5] [--workers 4]
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+import graph
+import synthetic
+from planner import WallPlanner, format_sweep
+
+
+def per_height(holds, heights):
+    # What a setter does today, one path() call per height
+    for height in heights:
+        planner = WallPlanner(holds, 'Pink')
+        start_state, foot_holds = planner.default_start()
+        try:
+            planner.plan(height, foot_holds, start_state)
+        except graph.NoRouteError:
+            pass
+
+
+def sweep(holds, heights, workers):
+    planner = WallPlanner(holds, 'Pink')
+    start_state, foot_holds = planner.default_start()
+    return planner.sweep(heights, foot_holds, start_state, workers=workers)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--holds', type=int, nargs='+', default=[100, 300])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--heights', type=int, nargs=3, default=[150, 200, 5], metavar=('FROM', 'TO', 'STEP'))
+    parser.add_argument('--density', type=float, default=6.0, help="Holds per square metre")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    heights = list(range(args.heights[0], args.heights[1] + 1, args.heights[2]))
+
+    print(f"{len(heights)} heights, {args.workers} workers")
+    print(f"{'case':>8} {'per height s':>13} {'sweep s':>9} {'pool s':>8} {'solved':>7} {'reused':>7}")
+    for n_holds in args.holds:
+        for seed in args.seeds:
+            holds = synthetic.generate_wall(n_holds, seed, args.density, synthetic.wall_aspect(n_holds, args.density))
+            base, _ = timed(per_height, holds, heights)
+            serial, rows = timed(sweep, holds, heights, 0)
+            pool, _ = timed(sweep, holds, heights, args.workers)
+            solved = sum(row['status'] == 'ok' for row in rows)
+            reused = sum(row['reused_from'] is not None for row in rows)
+            print(f"{n_holds}/{seed:<4} {base:>13.2f} {serial:>9.2f} {pool:>8.2f} {solved:>7} {reused:>7}")
+
+    print()
+    print(format_sweep(rows))
+
+
+if __name__ == "__main__":
+    main()
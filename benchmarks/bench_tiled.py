@@ -0,0 +1,42 @@
+# Time per megapixel and hold count, whole-image letterbox vs tiled inference settings
+# Usage: python benchmarks/bench_tiled.py IMAGE [IMAGE ...] [--tiles 640 960 1280] [--overlap 0.25] [--workers 1]
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference
+from imaging import ImageHandle
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--tiles', type=int, nargs='+', default=[640, 960, 1280])
+    parser.add_argument('--overlap', type=float, default=0.25)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    inference.get_model(warmup=True)
+    print(f"{'image':<30} {'mode':<12} {'MP':>6} {'sec':>7} {'s/MP':>7} {'holds':>6}")
+    for path in args.images:
+        image = ImageHandle(path)
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+
+        start = time.perf_counter()
+        holds = inference.detect_holds(image, use_cache=False)
+        elapsed = time.perf_counter() - start
+        print(f"{os.path.basename(path):<30} {'letterbox':<12} {megapixels:>6.1f} {elapsed:>7.2f} {elapsed / megapixels:>7.3f} {len(holds):>6}")
+
+        for tile in args.tiles:
+            start = time.perf_counter()
+            holds = inference.detect_holds_tiled(image, tile=tile, overlap=args.overlap, batch_size=args.batch_size,
+                                                 workers=args.workers, use_cache=False)
+            elapsed = time.perf_counter() - start
+            print(f"{'':<30} {f'tile {tile}':<12} {megapixels:>6.1f} {elapsed:>7.2f} {elapsed / megapixels:>7.3f} {len(holds):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
+import sys
+import os
 import math
+import numpy as np
 import state
+import time
 from heapq import heappush, heappop
-from copy import deepcopy
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import instrument
+
+# Heuristic weights tried in turn by anytime_a_star, ending on uniform cost search
+ANYTIME_WEIGHTS = (2.0, 1.0, 0.5, 0.0)
+
+# Heuristics the searches take:
+#   'euclidean'  pixel distance to the goal. Far larger than the move costs, so the search is close to greedy:
+#                few expansions, routes often well above the cheapest. The default for single routes.
+#   'table'      lower bound on the cost left, from goal_move_tables. Admissible, so weight 1 is optimal,
+#                at many times the expansions of 'euclidean' on big walls. Opt-in, k_best_routes always uses it.
+heuristics = ('table', 'euclidean')
+# Table F values are whole numbers and tie a lot, among equals the deeper state goes first
+table_tie_break = 1e-6
 
 
 def euclidean_distance(pos1, pos2):
@@ -13,12 +30,8 @@ def euclidean_distance(pos1, pos2):
 def is_within_reach(node1, node2, reach_radius):
     return euclidean_distance(node1, node2) <= reach_radius
 
-def get_state_center(nodes, ids: tuple):
-    positions = []
-    for id in ids:
-        for node in nodes:
-            if node['id'] == id:
-                positions.append(tuple(node['center']))
+def get_state_center(index, ids: tuple):
+    positions = [tuple(index.center(id)) for id in ids]
 
     x, y = 0, 0
     for pos_x, pos_y in positions:
@@ -30,15 +43,21 @@ def get_state_center(nodes, ids: tuple):
 
     return x, y
 
-def get_heuristic(nodes, goal_node, start_state):
-    return euclidean_distance(tuple(get_state_center(nodes, tuple(start_state.values()))), goal_node['center'])
+def get_heuristic(index, goal_node, start_state):
+    return euclidean_distance(tuple(get_state_center(index, start_state)), goal_node['center'])
 
 def reconstruct_path(node):
-    node.parent.append(node.state)
-    return node.parent
+    # Walk the parent chain back to the start once the goal is found
+    path = []
+    while node is not None:
+        path.append(node.state)
+        node = node.parent
+    path.reverse()
+    return path
 
 
-def print_moves(steps: list):  # Expecting a list of dictionaries
+def print_moves(steps: list):  # Expecting a list of packed states
+    steps = [state.unpack_state(step) for step in steps]
     step_string = []
     step_string.append(f"Starting State: {steps[0]}")
     
@@ -53,173 +72,484 @@ def print_moves(steps: list):  # Expecting a list of dictionaries
     return step_string
 
 
-def generate_next_states(current_state, nodes, agent, goal_node, foot_hold_ids):
+def generate_next_states(current_state, index, reach, goal_pos, foot_mask, goal_moves=None):
     next_states = []
-    limbs = ["right_hand", "left_hand", "right_foot", "left_foot"]
+    current = current_state.state
 
-    # Parameters for reachability
-    max_vertical_reach = agent.vertical_reach  # Feet to hands max distance
-    max_horizontal_reach = agent.horizontal_reach * 0.8  # Hand-to-hand max horizontal distance
-
-    # Get current positions
-    hand_positions = {
-        "right_hand": next(node for node in nodes if node['id'] == current_state.state["right_hand"]),
-        "left_hand": next(node for node in nodes if node['id'] == current_state.state["left_hand"])
-    }
-    foot_positions = {
-        "right_foot": next(node for node in nodes if node['id'] == current_state.state["right_foot"]),
-        "left_foot": next(node for node in nodes if node['id'] == current_state.state["left_foot"])
-    }
+    # Get current positions in the index
+    right_hand, left_hand, right_foot, left_foot = [index.position[hold_id] for hold_id in current]
+    x, y, distances = index.x, index.y, index.distances
 
     # Determine the lowest hand position (largest y if y increases downward)
-    lowest_hand_y = max(hand_positions["right_hand"]['center'][1],
-                       hand_positions["left_hand"]['center'][1])
+    lowest_hand_y = max(y[right_hand], y[left_hand])
+
+    # Hands can't go on foot holds and must stay within vertical reach of the feet
+    lowest_foot = right_foot if y[right_foot] < y[left_foot] else left_foot
+    hand_targets = ~foot_mask & reach.vertical[lowest_foot]
+
+    # Feet stay below the hands and can't share a hold with a hand
+    foot_targets = y >= lowest_hand_y + 0.4 * reach.agent.height
+    foot_targets[right_hand] = False
+    foot_targets[left_hand] = False
+
+    # Each limb's candidates in one pass, crossing and spread rules included
+    candidates = [
+        hand_targets & (x >= x[left_hand]) & reach.hands[left_hand],
+        hand_targets & (x <= x[right_hand]) & reach.hands[right_hand],
+        foot_targets & (x >= x[left_foot]) & reach.feet[left_foot],
+        foot_targets & (x <= x[right_foot]) & reach.feet[right_foot],
+    ]
+
+    # Both feet can't be on the same foot hold
+    if foot_mask[left_foot]:
+        candidates[state.RIGHT_FOOT][left_foot] = False
+    if foot_mask[right_foot]:
+        candidates[state.LEFT_FOOT][right_foot] = False
+
+    if instrument.enabled:
+        count_rejects(index, reach, foot_mask, right_hand, left_hand, right_foot, left_foot)
+
+    if goal_moves is None:
+        # Hands head for the goal, feet follow the hands
+        hand_h = distances[goal_pos]
+        foot_h = np.minimum(distances[right_hand], distances[left_hand])
+        limb_h = (hand_h, hand_h, foot_h, foot_h)
+    else:
+        # Lower bound on the cost left after each move, see goal_move_tables
+        hand_moves, foot_moves = goal_moves
+        hand_h = min(hand_moves[right_hand], hand_moves[left_hand])
+        foot_h = 3 * min(foot_moves[right_foot], foot_moves[left_foot])
+        limb_h = (
+            np.minimum(hand_moves, hand_moves[left_hand]) + foot_h,
+            np.minimum(hand_moves, hand_moves[right_hand]) + foot_h,
+            hand_h + 3 * np.minimum(foot_moves, foot_moves[left_foot]),
+            hand_h + 3 * np.minimum(foot_moves, foot_moves[right_foot]),
+        )
+
+    for limb_idx, current_pos in enumerate((right_hand, left_hand, right_foot, left_foot)):
+        limb_targets = candidates[limb_idx]
+        limb_targets[current_pos] = False  # Skip if the limb is already on this node
+        targets = np.flatnonzero(limb_targets)
+
+        if limb_idx in (state.RIGHT_HAND, state.LEFT_HAND):
+            move_cost = 1  # Assign lower movement cost for hands
+        else:
+            move_cost = 3
+        h_values = limb_h[limb_idx][targets]
+
+        # Calculate g(n), F is g + h
+        g = current_state.g + move_cost
+        for target_pos, h in zip(targets.tolist(), h_values.tolist()):
+            limb_positions = current[:limb_idx] + (index.ids[target_pos],) + current[limb_idx + 1:]
+            next_states.append(state.Node(
+                F=g + h,
+                g=g,
+                h=h,
+                state=limb_positions,
+                parent=current_state
+            ))
 
-    for limb in limbs:
-        current_node_id = current_state.state[limb]
+    return next_states
 
-        # Generate potential moves for this limb
-        for target_node in nodes:
-            if target_node['id'] == current_node_id:
-                continue  # Skip if the limb is already on this node
 
-            # Enforce constraints based on limb type
-            if "hand" in limb:
+def count_rejects(index, reach, foot_mask, right_hand, left_hand, right_foot, left_foot):
+    # How many holds each rule of generate_next_states rules out, summed over the four limbs.
+    # A hold that breaks several rules counts once for each.
+    x, y = index.x, index.y
+    lowest_foot = right_foot if y[right_foot] < y[left_foot] else left_foot
+    lowest_hand_y = max(y[right_hand], y[left_hand])
+    rejects = {
+        'foot_hold': 2 * np.count_nonzero(foot_mask),
+        'vertical_reach': 2 * np.count_nonzero(~reach.vertical[lowest_foot]),
+        'hand_crossing': np.count_nonzero(x < x[left_hand]) + np.count_nonzero(x > x[right_hand]),
+        'hand_spread': np.count_nonzero(~reach.hands[left_hand]) + np.count_nonzero(~reach.hands[right_hand]),
+        'feet_below_hands': 2 * np.count_nonzero(y < lowest_hand_y + 0.4 * reach.agent.height),
+        'hand_occupied': 2 * len({right_hand, left_hand}),
+        'foot_crossing': np.count_nonzero(x < x[left_foot]) + np.count_nonzero(x > x[right_foot]),
+        'foot_spread': np.count_nonzero(~reach.feet[left_foot]) + np.count_nonzero(~reach.feet[right_foot]),
+        'shared_foot_hold': int(foot_mask[left_foot]) + int(foot_mask[right_foot]),
+    }
+    for rule, rejected in rejects.items():
+        instrument.count(f'reject.{rule}', int(rejected))
 
-                # If the target hold is a foot hold, skip it
-                if target_node['id'] in foot_hold_ids:
-                    continue
 
-                # Prevent crossing arms
-                other_hand = "left_hand" if limb == "right_hand" else "right_hand"
-                if limb == "right_hand":
-                    # Right hand should be to the right of left hand
-                    if target_node['center'][0] < hand_positions[other_hand]['center'][0]:
-                        continue
-                else:
-                    # Left hand should be to the left of right hand
-                    if target_node['center'][0] > hand_positions[other_hand]['center'][0]:
-                        continue
-
-                # Check vertical reach (from feet to hands)
-                lowest_foot = foot_positions["right_foot"] if foot_positions["right_foot"]['center'][1] < foot_positions["left_foot"]['center'][1] else foot_positions["left_foot"]
-                if euclidean_distance(target_node['center'], lowest_foot['center']) > max_vertical_reach:
-                    continue
+class SearchCancelled(Exception):
+    pass
 
-                # Check horizontal reach (hand-to-hand)
-                other_hand_pos = hand_positions[other_hand]['center']
-                if euclidean_distance(target_node['center'], other_hand_pos) > max_horizontal_reach:
-                    continue
 
-                # Assign lower movement cost for hands
-                move_cost = 1
+class NoRouteError(Exception):
+    # hold_id is the hold that blocks the route, if one could be singled out
+    def __init__(self, reason, hold_id=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.hold_id = hold_id
 
-            elif "foot" in limb:
 
-                other_foot = "left_foot" if limb == "right_foot" else "right_foot"
+def reachable_hand_holds(index, agent, start_state, foot_mask):
+    # Relaxed hand graph: a hand can only land within horizontal reach of the other hand,
+    # which is itself on a hold the hands already reached, and never on a foot hold.
+    # Every hold a hand can ever use is in the returned mask, the converse need not hold.
+    hand_reach = index.reach(agent).hands
+    reached = np.zeros(len(index), dtype=bool)
+    frontier = [index.position[start_state[state.RIGHT_HAND]], index.position[start_state[state.LEFT_HAND]]]
+    reached[frontier] = True
 
-                # If the target hold is a foot hold and the other foot is already on it, skip
-                if target_node['id'] in foot_hold_ids and foot_positions[other_foot]['id'] == target_node['id']:
-                    continue
+    while frontier:
+        within_reach = hand_reach[frontier].any(axis=0)
+        new_holds = within_reach & ~foot_mask & ~reached
+        reached |= new_holds
+        frontier = np.flatnonzero(new_holds).tolist()
+
+    return reached
+
+
+def goal_move_tables(index, agent, goal_pos, foot_mask):
+    # Per-hold lower bounds on the moves left, for the 'table' heuristic:
+    # hands[i]: hand moves for a hand on hold i to reach the goal, on the relaxed hand graph of
+    #   reachable_hand_holds. A hand lands within reach of the other hand, so a hand move lowers
+    #   min(hands[right hand], hands[left hand]) by at most one.
+    # feet[i]: foot moves until a foot on hold i is within vertical reach of the goal, which the
+    #   higher foot has to be for the last hand move. Feet land within reach of the other foot,
+    #   so a foot move lowers min(feet[right foot], feet[left foot]) by at most one.
+    # inf where the goal can't be reached. h = hand bound + 3 * foot bound never overestimates
+    # (hand moves cost 1, foot moves 3) and never drops by more than a move costs, so A* stays optimal.
+    reach = index.reach(agent)
+    key = (goal_pos, foot_mask.tobytes())
+    if key not in reach.goal_moves:
+        goal = np.zeros(len(index), dtype=bool)
+        goal[goal_pos] = True
+        # Hands never land on foot holds
+        hands = hops_to(reach.hands, goal, ~foot_mask | goal)
+        feet = hops_to(reach.feet, reach.vertical[goal_pos].copy(), np.ones(len(index), dtype=bool))
+        reach.goal_moves[key] = (hands, feet)
+    return reach.goal_moves[key]
+
+
+def table_heuristic(goal_moves, positions):
+    # h of a state from its limbs' positions, as generate_next_states computes it for successors
+    hand_moves, foot_moves = goal_moves
+    right_hand, left_hand, right_foot, left_foot = positions
+    return min(hand_moves[right_hand], hand_moves[left_hand]) + 3 * min(foot_moves[right_foot], foot_moves[left_foot])
+
+
+def hops_to(adjacency, targets, landing):
+    # Breadth first search backwards from the targets: fewest moves to a target hold when each move
+    # lands on a landing hold adjacent to the current one
+    moves = np.full(len(targets), np.inf)
+    moves[targets] = 0
+    frontier = np.flatnonzero(targets & landing)
+    steps = 0
+    while len(frontier):
+        steps += 1
+        new_holds = adjacency[frontier].any(axis=0) & np.isinf(moves)
+        moves[new_holds] = steps
+        frontier = np.flatnonzero(new_holds & landing)
+    return moves
+
+
+def precheck(index, agent, start_state, goal_node_id, foot_hold_ids):
+    # Cheap rejection of impossible problems before running a_star, raises NoRouteError
+    for limb, hold_id in zip(state.LIMBS, start_state):
+        if hold_id not in index:
+            raise NoRouteError(f"{limb} starts on hold {hold_id}, which is not on this wall", hold_id)
+    for hold_id in foot_hold_ids:
+        if hold_id not in index:
+            raise NoRouteError(f"Foot hold {hold_id} is not on this wall", hold_id)
+    if goal_node_id not in index:
+        raise NoRouteError(f"Goal hold {goal_node_id} is not on this wall", goal_node_id)
+
+    # Already on the goal
+    if goal_node_id in (start_state[state.RIGHT_HAND], start_state[state.LEFT_HAND]):
+        return
+
+    foot_mask = index.mask(foot_hold_ids)
+    if foot_mask[index.position[goal_node_id]]:
+        raise NoRouteError(f"Goal hold {goal_node_id} is marked as a foot hold", goal_node_id)
+
+    reached = reachable_hand_holds(index, agent, start_state, foot_mask)
+    if reached[index.position[goal_node_id]]:
+        return
+
+    # The bottleneck is the unreachable hand hold closest to one the hands can reach
+    max_horizontal_reach = agent.horizontal_reach * 0.8
+    reached_pos = np.flatnonzero(reached)
+    unreached_pos = np.flatnonzero(~reached & ~foot_mask)
+    gaps = index.distances[np.ix_(reached_pos, unreached_pos)]
+    from_idx, to_idx = np.unravel_index(np.argmin(gaps), gaps.shape)
+    from_id = index.ids[reached_pos[from_idx]]
+    to_id = index.ids[unreached_pos[to_idx]]
+    raise NoRouteError(
+        f"Goal hold {goal_node_id} is out of reach: hold {to_id} is {gaps[from_idx, to_idx]:.0f} away "
+        f"from hold {from_id}, further than the hand reach of {max_horizontal_reach:.0f}",
+        to_id
+    )
+
+
+def weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight=1.0,
+                    cost_bound=math.inf, deadline=None, max_expansions=None, stats=None, cancel=None,
+                    heuristic='euclidean'):
+    # One pass of A* ordered on g + weight * h, ignoring anything that costs cost_bound or more.
+    # Returns (goal node or None, completed), completed is False if the deadline
+    # (a time.perf_counter() value) or max_expansions (counted in stats) ran out first.
+    # stats is updated as the search runs, so another thread can read it for progress.
+    # Setting cancel (a threading.Event) makes the search raise SearchCancelled.
+    assert heuristic in heuristics, f"Unknown heuristic {heuristic}, expected one of {heuristics}"
+    if stats is None:
+        stats = state.SearchStats()
+    if not instrument.enabled:
+        return _weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight, cost_bound,
+                                deadline, max_expansions, stats, cancel, heuristic)
+
+    expansions, successors = stats.expansions, stats.successors
+    try:
+        with instrument.timer('a_star'):
+            return _weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight, cost_bound,
+                                    deadline, max_expansions, stats, cancel, heuristic)
+    finally:
+        instrument.count('a_star.expansions', stats.expansions - expansions)
+        instrument.count('a_star.successors', stats.successors - successors)
+
+
+def _weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight, cost_bound, deadline,
+                     max_expansions, stats, cancel, heuristic):
+    goal_node = index.get(goal_node_id)
+    goal_pos = index.position[goal_node_id]
+    foot_mask = index.mask(foot_hold_ids)
+    reach = index.reach(agent)
+    goal_moves = goal_move_tables(index, agent, goal_pos, foot_mask) if heuristic == 'table' else None
+
+    # Priority queue for A*, best_g holds the cheapest known cost to each state
+    frontier = []
+    if goal_moves is None:
+        start_h = get_heuristic(index, goal_node, start_state)
+    else:
+        start_h = table_heuristic(goal_moves, [index.position[hold_id] for hold_id in start_state])
+    start_node = state.Node(F=0, g=0, h=start_h, state=start_state, parent=None)
+    start_node.F = weight * start_node.h
+    heappush(frontier, start_node)
+    best_g = {start_state: 0}
+    stats.pushes += 1
+    stats.peak_frontier = max(stats.peak_frontier, 1)
 
-                # Prevent feet from occupying the same hold as hands
-                hands = [hand_positions["right_hand"]['id'], hand_positions["left_hand"]['id']]
-                if target_node['id'] in hands:
-                    continue
+    while frontier:
+        current_state = heappop(frontier)
 
-                # Prevent criss-crossing feet
-                if limb == "right_foot":
-                    # Right foot should be to the right of left foot
-                    if target_node['center'][0] < foot_positions["left_foot"]['center'][0]:
-                        continue
-                else:
-                    # Left foot should be to the left of right foot
-                    if target_node['center'][0] > foot_positions["right_foot"]['center'][0]:
-                        continue
+        # Lazy deletion, a cheaper copy of this state was pushed after this one
+        if current_state.g > best_g[current_state.state]:
+            stats.stale_pops += 1
+            continue
 
-                # Calculate the maximum allowed y-coordinate for the foot
-                max_foot_y = lowest_hand_y + 0.4 * agent.height
+        # Check if either hand reaches the goal node
+        if current_state.state[state.RIGHT_HAND] == goal_node_id or current_state.state[state.LEFT_HAND] == goal_node_id:
+            return current_state, True  # Goal reached
+
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None, False
+        if max_expansions is not None and stats.expansions >= max_expansions:
+            return None, False
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled()
+
+        stats.expansions += 1
+
+        # Generate next states, only keeping ones that improve on the best known g and stay under the bound
+        next_states = generate_next_states(current_state, index, reach, goal_pos, foot_mask, goal_moves)
+        stats.successors += len(next_states)
+        for next_state in next_states:
+            if next_state.g >= best_g.get(next_state.state, math.inf):
+                continue
+            # The table never overestimates, so g + h bounds the cost of any route through this state
+            if next_state.g + (next_state.h if goal_moves is not None else 0) >= cost_bound:
+                continue  # Also drops states the goal is out of reach from, their h is inf
+            if goal_moves is not None:
+                next_state.F = next_state.g * (1 - table_tie_break) + weight * next_state.h
+            elif weight != 1.0:
+                next_state.F = next_state.g + weight * next_state.h
+            best_g[next_state.state] = next_state.g
+            heappush(frontier, next_state)
+            stats.pushes += 1
+
+        stats.peak_frontier = max(stats.peak_frontier, len(frontier))
+
+    return None, True  # No path found
+
+
+def a_star(index, agent, start_state, goal_node_id, foot_hold_ids, stats=None, cancel=None, heuristic='euclidean',
+           weight=1.0):
+    # With the 'table' heuristic at weight 1 the route is a cheapest one. A larger weight expands less
+    # and its route costs at most about weight times the cheapest.
+    if stats is None:
+        stats = state.SearchStats()
+
+    goal, _ = weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight, stats=stats,
+                              cancel=cancel, heuristic=heuristic)
+    if goal is None:
+        return None, stats  # No path found
+
+    stats.cost = goal.g
+    stats.weight = weight
+    stats.optimal = heuristic == 'table' and weight <= 1.0
+    return reconstruct_path(goal), stats
+
+
+def anytime_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, time_budget=None,
+                   max_expansions=None, weights=ANYTIME_WEIGHTS, stats=None, cancel=None, heuristic='euclidean'):
+    # Restarting weighted A*: each pass uses a smaller weight and only looks for routes cheaper
+    # than the best one so far. A weight 0 pass is uniform cost search, so if it completes
+    # the best route is proven optimal, as it is after a weight 1 pass with the admissible 'table'
+    # heuristic. When the budget runs out the best route so far is returned.
+    if stats is None:
+        stats = state.SearchStats()
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+    best = None
+    for weight in weights:
+        goal, completed = weighted_a_star(index, agent, start_state, goal_node_id, foot_hold_ids, weight,
+                                          best.g if best is not None else math.inf,
+                                          deadline, max_expansions, stats, cancel, heuristic)
+        if goal is not None:
+            best = goal
+            stats.weight = weight
+            stats.cost = goal.g
+        if not completed:
+            break
+        if weight == 0 or (weight <= 1.0 and heuristic == 'table'):
+            stats.optimal = True
+            break
+
+    if best is None:
+        return None, stats  # No path found, or none within the budget
+    return reconstruct_path(best), stats
+
+def k_best_routes(index, agent, start_state, goal_node_id, foot_hold_ids, k, avoid_hold_ids=(), max_expansions=None,
+                  stats=None, cancel=None, heuristic='table'):
+    # Up to k different loopless routes from one search, as (cost, route) pairs cheapest first.
+    # a_star keeps the best g of each state, this keeps the k best, so a state is expanded once per
+    # distinct way of reaching it and every alternative grows out of the same search tree.
+    # Ordered on g + h with the admissible, consistent 'table' heuristic (at weight 1, like a_star),
+    # routes reach the goal cheapest first: the first is a cheapest route and each next one the cheapest
+    # left. With 'euclidean' they are only the first k found. Limbs never move onto a hold in
+    # avoid_hold_ids (start holds can still be let go of).
+    goal_node = index.get(goal_node_id)
+    goal_pos = index.position[goal_node_id]
+    foot_mask = index.mask(foot_hold_ids)
+    reach = index.reach(agent)
+    avoid = set(avoid_hold_ids)
+    goal_moves = goal_move_tables(index, agent, goal_pos, foot_mask) if heuristic == 'table' else None
+
+    if stats is None:
+        stats = state.SearchStats()
+
+    if goal_moves is None:
+        start_h = get_heuristic(index, goal_node, start_state)
+    else:
+        start_h = table_heuristic(goal_moves, [index.position[hold_id] for hold_id in start_state])
+    frontier = [state.Node(F=0, g=0, h=start_h, state=start_state, parent=None)]
+    best_g = {start_state: [0]}  # state -> the k cheapest g pushed for it
+    routes = {}  # route -> cost, routes are tuples of states so equal move sequences collapse
+    stats.pushes += 1
 
-                if target_node['center'][1] < max_foot_y:
-                    continue
+    while frontier and len(routes) < k:
+        current_state = heappop(frontier)
 
-                # Check feet proximity (feet should not be too far apart)
-                other_foot_pos = foot_positions[other_foot]['center']
-                if euclidean_distance(target_node['center'], other_foot_pos) > (max_vertical_reach / 2):
+        # Lazy deletion, k cheaper copies of this state were pushed after this one
+        costs = best_g[current_state.state]
+        if len(costs) >= k and current_state.g > max(costs):
+            stats.stale_pops += 1
+            continue
+
+        if current_state.state[state.RIGHT_HAND] == goal_node_id or current_state.state[state.LEFT_HAND] == goal_node_id:
+            routes.setdefault(tuple(reconstruct_path(current_state)), current_state.g)
+            continue
+
+        if max_expansions is not None and stats.expansions >= max_expansions:
+            break
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled()
+        stats.expansions += 1
+
+        # States already on this route would make a loop
+        on_route = set()
+        node = current_state
+        while node is not None:
+            on_route.add(node.state)
+            node = node.parent
+
+        next_states = generate_next_states(current_state, index, reach, goal_pos, foot_mask, goal_moves)
+        stats.successors += len(next_states)
+        for next_state in next_states:
+            if next_state.state in on_route or next_state.h == math.inf:
+                continue
+            if avoid and any(hold_id in avoid and hold_id not in current_state.state for hold_id in next_state.state):
+                continue
+            costs = best_g.setdefault(next_state.state, [])
+            if len(costs) >= k:
+                if next_state.g >= max(costs):
                     continue
+                costs.remove(max(costs))
+            costs.append(next_state.g)
+            if goal_moves is not None:
+                next_state.F = next_state.g * (1 - table_tie_break) + next_state.h
+            heappush(frontier, next_state)
+            stats.pushes += 1
 
-                move_cost = 3
-
-            else:
-                continue 
-
-            # Add valid move
-            limb_positions = deepcopy(current_state.state)
-            limb_positions[limb] = target_node['id']
-            new_state = None
-
-            # Define heuristic based on limb type
-            if "hand" in limb:
-                h = euclidean_distance(target_node['center'], goal_node['center'])
-            elif "foot" in limb:
-                h = min(
-                    euclidean_distance(target_node['center'], hand_positions["right_hand"]['center']),
-                    euclidean_distance(target_node['center'], hand_positions["left_hand"]['center'])
-                )
-
-            # Calculate g(n) and f(n)
-            g = current_state.g + move_cost
-            f = g + h
-
-            new_state = state.Node(
-                F=f,
-                g=g,
-                h=h,
-                state=limb_positions,
-                parent=deepcopy(current_state.parent)
-            )
-            new_state.parent.append(current_state.state)
-            next_states.append(new_state)
-
-    return next_states
-
-
-
+        stats.peak_frontier = max(stats.peak_frontier, len(frontier))
 
+    ranked = sorted(routes.items(), key=lambda item: item[1])
+    if ranked:
+        stats.cost = ranked[0][1]
+    return [(cost, list(route)) for route, cost in ranked]
 
-def a_star(nodes, agent, start_state, goal_node_id, foot_hold_ids):
-    goal_node = next(node for node in nodes if node['id'] == goal_node_id)
 
-    # Priority queue for A*
-    frontier = []
-    heappush(frontier, state.Node(F=0, g=0, h=euclidean_distance(tuple(get_state_center(nodes, tuple(start_state.values()))), goal_node['center']), state=start_state, parent=[]))  # (priority, state, path)
-    explored = set()
+def find_k_paths(k, index, agent, foot_hold_ids, start_state, avoid_hold_ids=(), stats=None, max_expansions=None,
+                 cancel=None, heuristic='table'):
+    # Alternative betas: up to k (cost, steps) pairs, cheapest first, steps as returned by find_path
+    goal_node_id = len(index)
 
-    while frontier:
-        current_state = heappop(frontier)
+    start_state = state.pack_state(start_state)
+    precheck(index, agent, start_state, goal_node_id, foot_hold_ids)
 
-        # Check if either hand reaches the goal node
-        if current_state.state["right_hand"] == goal_node_id or current_state.state["left_hand"] == goal_node_id:
-            path_taken = reconstruct_path(current_state)
-            return path_taken  # Goal reached
+    routes = k_best_routes(index, agent, start_state, goal_node_id, foot_hold_ids, k, avoid_hold_ids,
+                           max_expansions, stats, cancel, heuristic)
+    if not routes:
+        raise NoRouteError(f"No route to goal hold {goal_node_id}")
+    return [(cost, print_moves(route)) for cost, route in routes]
 
-        # Avoid revisiting states
-        state_tuple = tuple(current_state.state.values())
-        explored.add(state_tuple)
 
-        # Generate next states
-        for next_state in generate_next_states(current_state, nodes, agent, goal_node, foot_hold_ids):
-            if tuple(next_state.state.values()) in explored:
-                continue
-            heappush(frontier, next_state)
+def route_cost(index, agent, route, foot_hold_ids):
+    # Cost of following a route of packed states, None if any of its moves breaks the rules
+    reach = index.reach(agent)
+    foot_mask = index.mask(foot_hold_ids)
+    if any(hold_id not in index for step in route for hold_id in step):
+        return None
 
-    return None  # No path found
+    node = state.Node(F=0, g=0, h=0, state=route[0], parent=None)
+    for next_step in route[1:]:
+        node = next((child for child in generate_next_states(node, index, reach, 0, foot_mask)
+                     if child.state == next_step), None)
+        if node is None:
+            return None
+    return node.g
 
 # Example Usage
-def find_path(nodes, agent, foot_hold_ids, start_state):
-    goal_node_id = len(nodes)  # Goal node ID
-
-    steps = a_star(nodes, agent, start_state, goal_node_id, foot_hold_ids)
+def find_path(index, agent, foot_hold_ids, start_state, stats=None, time_budget=None, max_expansions=None,
+              cancel=None, heuristic='euclidean', weight=1.0):
+    goal_node_id = len(index)  # Goal node ID
+
+    start_state = state.pack_state(start_state)
+    precheck(index, agent, start_state, goal_node_id, foot_hold_ids)
+
+    # stats, if given, is filled in with the search statistics
+    # With a time (seconds) or expansion budget the best route found within it is returned,
+    # weight only applies without one, see a_star
+    if time_budget is None and max_expansions is None:
+        steps, stats = a_star(index, agent, start_state, goal_node_id, foot_hold_ids, stats, cancel, heuristic,
+                              weight)
+    else:
+        steps, stats = anytime_a_star(index, agent, start_state, goal_node_id, foot_hold_ids,
+                                      time_budget, max_expansions, stats=stats, cancel=cancel, heuristic=heuristic)
+    if steps is None:
+        raise NoRouteError(f"No route to goal hold {goal_node_id} after {stats.expansions} expansions")
 
 
     # Output the steps
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class HoldIndex:
+    # Built once per wall: O(1) id -> hold lookup and hold centers kept in contiguous arrays
+    def __init__(self, holds):
+        self.holds = list(holds)
+        self.ids = [hold['id'] for hold in self.holds]
+        self.centers = np.ascontiguousarray(
+            np.array([hold['center'] for hold in self.holds], dtype=np.float64).reshape(-1, 2)
+        )
+        self.x = self.centers[:, 0]
+        self.y = self.centers[:, 1]
+        self.position = {hold['id']: pos for pos, hold in enumerate(self.holds)}
+
+        # Pairwise hold-to-hold distances, computed once per wall
+        # float_power goes through C pow() like graph.euclidean_distance's ** 2, so values match it bit for bit
+        dx = self.x[None, :] - self.x[:, None]
+        dy = self.y[None, :] - self.y[:, None]
+        self.distances = np.sqrt(np.float_power(dx, 2.0) + np.float_power(dy, 2.0))
+
+        self._reach_tables = {}
+
+    def __len__(self):
+        return len(self.holds)
+
+    def __iter__(self):
+        return iter(self.holds)
+
+    def __contains__(self, hold_id):
+        return hold_id in self.position
+
+    def get(self, hold_id):
+        return self.holds[self.position[hold_id]]
+
+    def center(self, hold_id):
+        return self.centers[self.position[hold_id]]
+
+    def mask(self, hold_ids):
+        # Boolean array over positions, ids that are not on this wall are ignored
+        mask = np.zeros(len(self.holds), dtype=bool)
+        mask[[self.position[hold_id] for hold_id in hold_ids if hold_id in self.position]] = True
+        return mask
+
+    def reach(self, agent):
+        # Reach tables are cached per climber size, so repeated searches on this wall share them
+        key = (agent.height, agent.horizontal_reach, agent.vertical_reach)
+        if key not in self._reach_tables:
+            self._reach_tables[key] = ReachTable(self, agent)
+        return self._reach_tables[key]
+
+
+class ReachTable:
+    # Which holds are within each of the climber's reach limits of each other
+    def __init__(self, index, agent, tables=None):
+        self.agent = agent
+        self.goal_moves = {}  # Heuristic tables, see graph.goal_move_tables
+        if tables is not None:
+            # Precomputed (hands, vertical, feet), e.g. loaded from a wall file
+            self.hands, self.vertical, self.feet = tables
+            return
+        self.hands = index.distances <= agent.horizontal_reach * 0.8  # Hand-to-hand max horizontal distance
+        self.vertical = index.distances <= agent.vertical_reach  # Feet to hands max distance
+        self.feet = index.distances <= agent.vertical_reach / 2  # Feet should not be too far apart
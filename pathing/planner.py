@@ -0,0 +1,305 @@
+import sys
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import postprocess
+import instrument
+import agent
+import graph
+import state
+from hold_index import HoldIndex
+
+
+class WallPlanner:
+    # Everything that only depends on the wall (filtered holds, index, distance matrix, reach tables)
+    # is built once, so repeated "Generate Steps" queries on the same wall only pay for the search
+    def __init__(self, holds, colour):
+        self.colour = colour
+
+        # Gather the holds and re-id them bottom to top, the top hold is the goal.
+        # detection_id keeps each hold's id in the detection result.
+        filtered_holds_by_y = postprocess.filter_holds(holds, colour)
+        if isinstance(filtered_holds_by_y, postprocess.Holds):
+            filtered_holds_by_y = filtered_holds_by_y.to_dicts()
+        with instrument.timer('re_id'):
+            self.holds = [dict(hold, id=x + 1, detection_id=hold['id']) for x, hold in enumerate(filtered_holds_by_y)]
+            self.index = HoldIndex(self.holds)
+        self.goal_node_id = len(self.holds)
+
+        # Determine the height of the puzzle
+        self.puzzle_height = self.holds[0]['center'][1]
+
+        self._climbers = {}
+        self._routes = {}  # (height, foot holds) -> {(start state, budget, heuristic): (route, cost, optimal)}
+        self._alternatives = {}
+
+    def climber(self, user_height):
+        user_height = int(user_height)
+        if user_height not in self._climbers:
+            # Determine the users 'scaled' height to be in ratio with yolov5's units
+            avg_wall_height = 500  # in cm, for ratios
+            scaled_user_height = (user_height / avg_wall_height) * self.puzzle_height
+            self._climbers[user_height] = agent.climber(scaled_user_height)
+        return self._climbers[user_height]
+
+    def plan_route(self, user_height, foot_hold_ids, start_state, time_budget=None, max_expansions=None, stats=None,
+                   cancel=None, heuristic='euclidean'):
+        # Returns the route as a list of packed states, raises graph.NoRouteError.
+        # heuristic='table' finds a cheapest route, at more expansions, see graph.heuristics
+        climber = self.climber(user_height)
+        foot_hold_ids = tuple(sorted(set(foot_hold_ids)))
+        start_state = state.pack_state(start_state) if isinstance(start_state, dict) else tuple(start_state)
+        if stats is None:
+            stats = state.SearchStats()
+
+        # Same question as before, same answer
+        routes = self._routes.setdefault((int(user_height), foot_hold_ids), {})
+        query = (start_state, time_budget, max_expansions, heuristic)
+        if query in routes:
+            route, stats.cost, stats.optimal = routes[query]
+            return route
+
+        graph.precheck(self.index, climber, start_state, self.goal_node_id, foot_hold_ids)
+
+        # Incremental replanning: the rest of a proven cheapest route through the new start, planned for
+        # this height and these foot holds, is a cheapest route from there too, so no search can beat it
+        route = self._known_route(routes, start_state)
+        if route is not None:
+            stats.cost = graph.route_cost(self.index, climber, route, foot_hold_ids)
+            stats.optimal = True
+        elif time_budget is None and max_expansions is None:
+            route, stats = graph.a_star(self.index, climber, start_state, self.goal_node_id, foot_hold_ids,
+                                        stats, cancel, heuristic)
+        else:
+            route, stats = graph.anytime_a_star(self.index, climber, start_state, self.goal_node_id, foot_hold_ids,
+                                                time_budget, max_expansions, stats=stats, cancel=cancel,
+                                                heuristic=heuristic)
+        if route is None:
+            raise graph.NoRouteError(f"No route to goal hold {self.goal_node_id} after {stats.expansions} expansions")
+
+        routes[query] = (route, stats.cost, stats.optimal)
+        return route
+
+    def plan(self, user_height, foot_holds, start_state, time_budget=None, max_expansions=None, stats=None,
+             cancel=None, heuristic='euclidean'):
+        # Same arguments as pathing.path, foot holds are a space separated string of ids
+        foot_hold_ids = [int(x) for x in foot_holds.split()]
+        route = self.plan_route(user_height, foot_hold_ids, start_state, time_budget, max_expansions, stats, cancel,
+                                heuristic)
+        return graph.print_moves(route)
+
+    def plan_alternatives(self, k, user_height, foot_holds, start_state, avoid_holds='', max_expansions=None,
+                          stats=None, cancel=None):
+        # Up to k alternative betas as (cost, steps) pairs, cheapest first, see graph.k_best_routes.
+        # avoid_holds is a space separated string of hold ids no limb may use.
+        foot_hold_ids = tuple(sorted(int(x) for x in foot_holds.split()))
+        avoid_hold_ids = tuple(sorted(int(x) for x in avoid_holds.split()))
+        start_state = state.pack_state(start_state) if isinstance(start_state, dict) else tuple(start_state)
+        climber = self.climber(user_height)
+
+        query = (int(user_height), foot_hold_ids, start_state, k, avoid_hold_ids, max_expansions)
+        if query not in self._alternatives:
+            graph.precheck(self.index, climber, start_state, self.goal_node_id, foot_hold_ids)
+            routes = graph.k_best_routes(self.index, climber, start_state, self.goal_node_id, foot_hold_ids, k,
+                                         avoid_hold_ids, max_expansions, stats, cancel)
+            if not routes:
+                raise graph.NoRouteError(f"No route to goal hold {self.goal_node_id} avoiding holds {avoid_holds}")
+            self._alternatives[query] = routes
+        return [(cost, graph.print_moves(route)) for cost, route in self._alternatives[query]]
+
+    def default_start(self):
+        # Start state and foot holds when none are given: feet on the two lowest holds, hands on the next two
+        if len(self.holds) < 4:
+            raise graph.NoRouteError(f"Only {len(self.holds)} {self.colour} holds, a start needs 4")
+        feet = sorted(self.holds[:2], key=lambda hold: hold['center'][0])
+        hands = sorted(self.holds[2:4], key=lambda hold: hold['center'][0])
+        start_state = {
+            "right_hand": hands[1]['id'],
+            "left_hand": hands[0]['id'],
+            "right_foot": feet[1]['id'],
+            "left_foot": feet[0]['id']
+        }
+        return start_state, f"{feet[0]['id']} {feet[1]['id']}"
+
+    def sweep(self, heights, foot_holds, start_state, time_budget=None, max_expansions=None, workers=None,
+              cancel=None, heuristic='euclidean'):
+        # Plans the same problem for every height in heights (cm), one search per height spread over a
+        # process pool. Returns one result dict per height, shortest first, see format_sweep.
+        # Setting cancel (a threading.Event) stops every search and raises graph.SearchCancelled.
+        heights = sorted({int(height) for height in heights})
+        foot_hold_ids = tuple(sorted(int(x) for x in foot_holds.split()))
+        start_state = state.pack_state(start_state) if isinstance(start_state, dict) else tuple(start_state)
+        rows = {height: {'height': height, 'status': None, 'moves': None, 'cost': None, 'seconds': 0.0,
+                         'reused_from': None} for height in heights}
+
+        # precheck only looks at hand reach, which grows with height, so once it fails
+        # every shorter climber fails too and isn't checked
+        out_of_reach = None
+        for height in reversed(heights):
+            row = rows[height]
+            if out_of_reach is not None:
+                row['status'] = 'no_route'
+                row['reason'] = f"Out of reach at {out_of_reach} cm already"
+                continue
+            try:
+                graph.precheck(self.index, self.climber(height), start_state, self.goal_node_id, foot_hold_ids)
+            except graph.NoRouteError as e:
+                row['status'] = 'no_route'
+                row['reason'] = e.reason
+                out_of_reach = height
+
+        # The pool's workers get a copy of this planner, reach tables included, instead of rebuilding it
+        todo = [height for height in heights if rows[height]['status'] is None]
+        if workers == 0 or len(todo) < 2:
+            results = [sweep_height(self, height, foot_hold_ids, start_state, time_budget, max_expansions, cancel,
+                                    heuristic)
+                       for height in todo]
+        else:
+            pool_cancel = multiprocessing.Event()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(pool_cancel, self)) as pool:
+                futures = [pool.submit(_sweep_worker, height, foot_hold_ids, start_state, time_budget, max_expansions,
+                                       heuristic)
+                           for height in todo]
+                results = _wait_all(futures, cancel, pool_cancel)
+
+        routes = []
+        for height, (route, optimal, reason, seconds) in zip(todo, results):
+            row = rows[height]
+            row['seconds'] = seconds
+            if route is None:
+                row['status'] = 'no_route'
+                row['reason'] = reason
+                continue
+            cost = graph.route_cost(self.index, self.climber(height), route, foot_hold_ids)
+            row.update(status='ok', moves=len(route) - 1, cost=cost, steps=graph.print_moves(route))
+            routes.append((cost, height, route))
+            query = (start_state, time_budget, max_expansions, heuristic)
+            self._routes.setdefault((height, foot_hold_ids), {}).setdefault(query, (route, cost, optimal))
+
+        # Taller climbers reach further, so a route found at one height often works at others. Moves cost
+        # the same at any height, so a cheaper route from another height replaces a height's own (or fills
+        # in for a search that found nothing) if it passes the rules there: feet have to stay further below
+        # the hands the taller the climber is, so it isn't guaranteed.
+        routes.sort(key=lambda item: item[0])
+        for height in todo:
+            row = rows[height]
+            for cost, other, route in routes:
+                if row['cost'] is not None and cost >= row['cost']:
+                    break
+                if graph.route_cost(self.index, self.climber(height), route, foot_hold_ids) is not None:
+                    row.update(status='ok', moves=len(route) - 1, cost=cost, steps=graph.print_moves(route),
+                               reused_from=other)
+                    row.pop('reason', None)
+                    break
+        return [rows[height] for height in heights]
+
+    def _known_route(self, routes, start_state):
+        for route, _, optimal in routes.values():
+            if optimal and start_state in route:
+                return route[route.index(start_state):]
+        return None
+
+
+def plan_colour(holds, colour, user_height, time_budget=None, max_expansions=None, cancel=None,
+                heuristic='euclidean'):
+    # One colour of an all-colours run, returns a result dict instead of raising so one bad colour
+    # doesn't sink the rest (graph.SearchCancelled still goes through)
+    start = time.perf_counter()
+    result = {'colour': colour, 'holds': len(holds)}
+    try:
+        planner = WallPlanner(holds, colour)
+        start_state, foot_holds = planner.default_start()
+        result['start_state'] = start_state
+        result['foot_holds'] = foot_holds
+        result['steps'] = planner.plan(user_height, foot_holds, start_state, time_budget, max_expansions,
+                                       cancel=cancel, heuristic=heuristic)
+        result['status'] = 'ok'
+    except graph.NoRouteError as e:
+        result['status'] = 'no_route'
+        result['reason'] = e.reason
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def plan_all_colours(holds, user_height, time_budget=None, max_expansions=None, workers=None, cancel=None,
+                     heuristic='euclidean'):
+    # Plans every colour on the wall from one detection, one search per colour spread over a process pool.
+    # Returns {colour: result dict from plan_colour}, ordered by colour name.
+    # Setting cancel (a threading.Event) stops every search and raises graph.SearchCancelled.
+    if not isinstance(holds, postprocess.Holds):
+        holds = postprocess.Holds.from_dicts(holds)
+    groups = holds.by_class()
+    if workers == 0 or len(groups) < 2:
+        return {colour: plan_colour(group, colour, user_height, time_budget, max_expansions, cancel, heuristic)
+                for colour, group in sorted(groups.items())}
+
+    colours = sorted(groups)
+    pool_cancel = multiprocessing.Event()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pool_cancel,)) as pool:
+        futures = [pool.submit(_plan_colour_worker, groups[colour], colour, user_height, time_budget, max_expansions,
+                               heuristic)
+                   for colour in colours]
+        return dict(zip(colours, _wait_all(futures, cancel, pool_cancel)))
+
+
+def sweep_height(planner, height, foot_hold_ids, start_state, time_budget=None, max_expansions=None, cancel=None,
+                 heuristic='euclidean'):
+    # One height of WallPlanner.sweep, returns (route or None, proven cheapest, reason, seconds)
+    start = time.perf_counter()
+    stats = state.SearchStats()
+    try:
+        route = planner.plan_route(height, foot_hold_ids, start_state, time_budget, max_expansions, stats, cancel,
+                                   heuristic)
+        reason = None
+    except graph.NoRouteError as e:
+        route, reason = None, e.reason
+    return route, stats.optimal, reason, time.perf_counter() - start
+
+
+# Process pool workers get these once, from _init_worker
+_worker_cancel = None  # multiprocessing.Event, set by the parent through _wait_all
+_sweep_planner = None
+
+
+def _init_worker(cancel, planner=None):
+    global _worker_cancel, _sweep_planner
+    _worker_cancel = cancel
+    _sweep_planner = planner
+
+
+def _sweep_worker(height, foot_hold_ids, start_state, time_budget, max_expansions, heuristic):
+    return sweep_height(_sweep_planner, height, foot_hold_ids, start_state, time_budget, max_expansions,
+                        _worker_cancel, heuristic)
+
+
+def _plan_colour_worker(holds, colour, user_height, time_budget, max_expansions, heuristic):
+    return plan_colour(holds, colour, user_height, time_budget, max_expansions, _worker_cancel, heuristic)
+
+
+def _wait_all(futures, cancel, pool_cancel):
+    # Results of futures in order. A threading.Event can't reach other processes, so once cancel is set
+    # the workers are stopped through pool_cancel and graph.SearchCancelled is raised.
+    pending = set(futures)
+    while pending:
+        _, pending = wait(pending, timeout=0.05)
+        if pending and cancel is not None and cancel.is_set():
+            pool_cancel.set()
+            for future in pending:
+                future.cancel()
+            raise graph.SearchCancelled()
+    return [future.result() for future in futures]
+
+
+def format_sweep(rows):
+    # Compact text table of WallPlanner.sweep results
+    lines = [f"{'height':>6} {'moves':>6} {'cost':>9} {'ms':>9}  note"]
+    for row in rows:
+        if row['status'] == 'ok':
+            note = f"route from {row['reused_from']} cm" if row['reused_from'] is not None else ''
+            lines.append(f"{row['height']:>6} {row['moves']:>6} {row['cost']:>9.1f} {row['seconds'] * 1000:>9.1f}  {note}")
+        else:
+            lines.append(f"{row['height']:>6} {'-':>6} {'-':>9} {row['seconds'] * 1000:>9.1f}  {row['reason']}")
+    return '\n'.join(lines)
@@ -1,13 +1,45 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+
+
+# Climber states are packed as a 4-tuple of hold ids in LIMBS order, hashable as-is
+LIMBS = ("right_hand", "left_hand", "right_foot", "left_foot")
+RIGHT_HAND, LEFT_HAND, RIGHT_FOOT, LEFT_FOOT = range(4)
+
+
+def pack_state(limb_positions: dict) -> tuple:
+    return tuple(limb_positions[limb] for limb in LIMBS)
+
+
+def unpack_state(packed: tuple) -> dict:
+    return dict(zip(LIMBS, packed))
 
 
-@dataclass(order=True) # Allows the pq sort properly
 class Node:
-    F: float # g + h
-    g: float = field(compare=False)
-    h: float = field(compare=False) # compare=False enforces that the variable should not be considered when sorting Nodes in pq
-    state: dict = field(compare=False)
-    parent: list = field(compare=False)
-
-    def __post_init__(self):
-        self.F = self.g + self.h
\ No newline at end of file
+    # __slots__ keeps frontier entries small, there are a lot of them
+    __slots__ = ("F", "g", "h", "state", "parent")
+
+    def __init__(self, F, g, h, state, parent):
+        self.g = g
+        self.h = h
+        self.F = g + h # F is always g + h, the passed value is ignored
+        self.state = state # Packed tuple of hold ids
+        self.parent = parent # Node this one was expanded from, None for the start
+
+    def __lt__(self, other): # Allows the pq sort properly, only F is compared
+        return self.F < other.F
+
+    def __repr__(self):
+        return f"Node(F={self.F}, g={self.g}, h={self.h}, state={self.state})"
+
+
+
+@dataclass
+class SearchStats:
+    expansions: int = 0 # States expanded
+    pushes: int = 0 # Nodes pushed onto the frontier
+    stale_pops: int = 0 # Superseded frontier entries skipped on pop
+    peak_frontier: int = 0 # Largest frontier size seen
+    successors: int = 0 # Successor states generated
+    cost: float = None # Cost of the returned route
+    weight: float = 1.0 # Heuristic weight of the search that found it
+    optimal: bool = False # Route is proven to be the cheapest
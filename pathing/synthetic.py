@@ -0,0 +1,42 @@
+# Seedable synthetic walls in detect_holds format, for benchmarks and trying the planner without a photo
+import random
+
+colour_names = (
+    'Black', 'Blue', 'Brown', 'Cream', 'Gray', 'Green',
+    'Orange', 'Pink', 'Purple', 'Red', 'White', 'Yellow'
+)
+pixels_per_metre = 200
+
+
+def generate_wall(n_holds, seed=0, density=6.0, aspect=1.0, colours=None, hold_size=(0.05, 0.3)):
+    # n_holds holds scattered uniformly over a wall with density holds per square metre and
+    # aspect = width / height. colours is a list of class names or a {name: weight} mix, one colour
+    # by default. hold_size is the (min, max) box side in metres.
+    rng = random.Random(seed)
+    colours = colours or ['Pink']
+    if not isinstance(colours, dict):
+        colours = {colour: 1.0 for colour in colours}
+    names, weights = list(colours), list(colours.values())
+
+    area = n_holds / density
+    height = (area / aspect) ** 0.5 * pixels_per_metre
+    width = aspect * height
+
+    holds = []
+    for hold_id in range(n_holds):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        w, h = (rng.uniform(*hold_size) * pixels_per_metre for _ in range(2))
+        box = [x - w / 2, y - h / 2, x + w / 2, y + h / 2]
+        holds.append({
+            'id': hold_id,
+            'class': rng.choices(names, weights)[0],
+            'confidence': rng.uniform(0.25, 1.0),
+            'box': box,
+            'center': [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2],
+        })
+    return holds
+
+
+def wall_aspect(n_holds, density=6.0, height_m=4.5):
+    # Aspect that gives a wall of height_m metres for this hold count and density
+    return n_holds / density / height_m ** 2
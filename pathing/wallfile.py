@@ -0,0 +1,111 @@
+# Processed walls on disk, so a photo only goes through the model once.
+# A wall file is an .npz holding the detection arrays, the hold id each colour's planner uses
+# for every detection, and optionally the reach tables for some climber heights.
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import postprocess
+from planner import WallPlanner
+from hold_index import ReachTable
+
+version = 2  # 2: orders hold detection ids (1 stored the planner ids 1..n)
+
+
+class Wall:
+    def __init__(self, holds, source_image=None, source_hash=None, orders=None, reach=None):
+        self.holds = holds  # postprocess.Holds
+        self.source_image = source_image
+        self.source_hash = source_hash
+        self.orders = orders or {}  # colour -> detection ids, planner hold id n is orders[colour][n - 1]
+        self.reach = reach or {}  # (colour, height) -> (hands, vertical, feet) boolean matrices
+        self._planners = {}
+
+    def colours(self):
+        return sorted(set(self.holds.names[code] for code in self.holds.cls.tolist()))
+
+    def planner(self, colour):
+        # WallPlanner for one colour, with any stored reach tables already in place
+        if colour not in self._planners:
+            planner = WallPlanner(self.holds, colour)
+            ids = [hold['detection_id'] for hold in planner.holds]
+            if colour in self.orders:
+                assert ids == self.orders[colour].tolist(), f"Hold ids for {colour} don't match the wall file"
+            for (reach_colour, height), tables in self.reach.items():
+                if reach_colour == colour:
+                    climber = planner.climber(height)
+                    key = (climber.height, climber.horizontal_reach, climber.vertical_reach)
+                    planner.index._reach_tables[key] = ReachTable(planner.index, climber, tables)
+            self._planners[colour] = planner
+        return self._planners[colour]
+
+    def detection_id(self, colour, hold_id):
+        # Planner hold id (what the steps refer to) -> detection id
+        return int(self.orders[colour][hold_id - 1])
+
+
+def save_wall(path, holds, source_image=None, source_hash=None, heights=(), colours=None):
+    # holds is a detect_holds result (Holds or hold dicts). Reach tables are stored for every
+    # height in heights and every colour in colours (default: all colours on the wall).
+    if not isinstance(holds, postprocess.Holds):
+        holds = postprocess.Holds.from_dicts(holds)
+    wall = Wall(holds, source_image, source_hash)
+    colours = wall.colours() if colours is None else colours
+
+    arrays = {
+        'version': np.array(version),
+        'boxes': holds.boxes,
+        'conf': holds.conf,
+        'cls': holds.cls,
+        'ids': holds.ids,
+        'names': np.array(holds.names, dtype=str),
+        'source_image': np.array(source_image or '', dtype=str),
+        'source_hash': np.array(source_hash or '', dtype=str),
+    }
+    for colour in colours:
+        try:
+            planner = wall.planner(colour)
+        except IndexError:
+            continue  # No holds of this colour
+        arrays[f'order/{colour}'] = np.array([hold['detection_id'] for hold in planner.holds], dtype=np.int64)
+        for height in heights:
+            reach = planner.index.reach(planner.climber(height))
+            # Packed to one bit per pair, the matrices are n x n
+            for name in ('hands', 'vertical', 'feet'):
+                arrays[f'reach/{colour}/{int(height)}/{name}'] = np.packbits(getattr(reach, name), axis=1)
+
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(path + '.tmp', path)
+    return wall
+
+
+def load_wall(path):
+    with np.load(path) as data:
+        assert int(data['version']) == version, f"{path} is wall format version {int(data['version'])}, expected {version}"
+        holds = postprocess.Holds(data['boxes'], data['conf'], data['cls'], data['names'].tolist(), data['ids'])
+        orders, packed = {}, {}
+        for key in data.files:
+            if key.startswith('order/'):
+                orders[key.split('/', 1)[1]] = data[key]
+            elif key.startswith('reach/'):
+                _, colour, height, name = key.split('/')
+                packed.setdefault((colour, int(height)), {})[name] = data[key]
+        source_image = str(data['source_image']) or None
+        source_hash = str(data['source_hash']) or None
+
+    reach = {}
+    for (colour, height), tables in packed.items():
+        n = len(orders[colour])
+        reach[(colour, height)] = tuple(np.unpackbits(tables[name], axis=1, count=n).astype(bool)
+                                        for name in ('hands', 'vertical', 'feet'))
+    return Wall(holds, source_image, source_hash, orders, reach)
+
+
+def file_version(path):
+    with np.load(path) as data:
+        return int(data['version'])
+
+
+def is_wall_file(path):
+    return path.lower().endswith('.npz')
@@ -0,0 +1,48 @@
+# inference.detect_holds and detect_holds_batch as the first detections of a fresh process, with the model
+# replaced by a stub but predict's imports (torch, YOLOv5's NMS) left real, so they have to resolve
+# without anything having called get_model first. Needs torch and the YOLOv5 checkout next to ML/.
+import sys
+import os
+import subprocess
+import pytest
+
+root = os.path.join(os.path.dirname(__file__), '..')
+
+script = '''
+import sys
+import cv2
+import numpy as np
+import torch
+sys.path.append({ml!r})
+import inference
+
+
+class StubModel:
+    # Raw YOLOv5 output: one box (centre x, centre y, w, h, objectness, class scores) per image
+    names = {{0: 'Pink', 1: 'Blue'}}
+
+    def __call__(self, batch):
+        row = torch.tensor([320.0, 320.0, 100.0, 60.0, 0.9, 0.95, 0.05])
+        return row.repeat(len(batch), 1, 1)
+
+
+inference.model = StubModel()
+inference.device = 'cpu'
+inference.model_identity = lambda: 'stub'
+cv2.imwrite({image!r}, np.full((480, 640, 3), 128, np.uint8))
+
+holds = inference.detect_holds({image!r})
+assert [hold['class'] for hold in holds] == ['Pink'], holds
+batch = inference.detect_holds_batch([{image!r}], use_cache=False)
+assert batch == [holds], batch
+'''
+
+
+def test_first_detection_in_fresh_process(tmp_path):
+    pytest.importorskip('torch')
+    if not os.path.isdir(os.path.join(root, 'yolov5')):
+        pytest.skip("No YOLOv5 checkout next to ML/")
+
+    code = script.format(ml=os.path.join(root, 'ML'), image=str(tmp_path / 'wall.png'))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
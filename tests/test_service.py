@@ -0,0 +1,133 @@
+# ML/service.py end to end on a temporary Unix socket, with the model replaced by a stub so it runs
+# without torch or weights: concurrent requests share forward passes, clients get what detect_holds
+# returns in process, and a bad image only fails its own request.
+import sys
+import os
+import time
+import asyncio
+import threading
+import cv2
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import inference
+import instrument
+import service
+from postprocess import Holds
+
+n_clients = 8
+
+
+def fake_predict(images):
+    # Slow enough for requests to pile up behind a running batch
+    time.sleep(0.02)
+    return [np.array([[10, 20, 30, 40, 0.9, 1], [50, 60, 70, 80, 0.5, 0]], dtype=float) for _ in images]
+
+
+def fake_to_holds(pred, letterbox):
+    # Boxes shifted by the image height, so every image gets different holds
+    height = letterbox[3][0]
+    return Holds.from_prediction(pred + np.array([height] * 4 + [0, 0]), {0: 'Pink', 1: 'Blue'})
+
+
+@pytest.fixture
+def address(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference, 'model_identity', lambda: 'stub')
+    monkeypatch.setattr(inference, 'predict', fake_predict)
+    monkeypatch.setattr(inference, 'to_holds', fake_to_holds)
+    monkeypatch.setattr(inference, 'service_address', None)
+    monkeypatch.setattr(instrument, 'enabled', True)
+    instrument.reset()
+
+    address = str(tmp_path / 'inference.sock')
+    ready = threading.Event()
+    running = {}
+
+    async def serve():
+        # asyncio.run cancels the open connections when serve is cancelled
+        running['loop'], running['task'] = asyncio.get_running_loop(), asyncio.current_task()
+        try:
+            await service.InferenceService(max_batch=8, max_wait=0.01).serve(address, ready)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    assert ready.wait(5), "Inference service didn't start"
+    yield address
+
+    inference.set_service(None)
+    running['loop'].call_soon_threadsafe(running['task'].cancel)
+    thread.join(5)
+    assert not thread.is_alive()
+    instrument.reset()
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(n_clients):
+        path = str(tmp_path / f'{i}.png')
+        cv2.imwrite(path, np.full((100 + i, 120, 3), i * 20, np.uint8))
+        paths.append(path)
+    return paths
+
+
+def run_clients(target):
+    errors = []
+
+    def client(k):
+        try:
+            target(k)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(n_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_matches_in_process_and_batches(address, images):
+    expected = {path: inference.run_detection(path).to_dicts() for path in images}
+    inference.set_service(address)
+    results = {}
+
+    def client(k):
+        for j in range(4):
+            path = images[(k + j) % len(images)]
+            results[k, j] = (path, inference.detect_holds(path, use_cache=False))
+
+    assert run_clients(client) == []
+    assert len(results) == n_clients * 4
+    for path, holds in results.values():
+        assert holds == expected[path]
+
+    counters = instrument.snapshot()['counters']
+    assert counters['service.images'] == n_clients * 4
+    assert counters['service.batches'] < n_clients * 4
+
+
+def test_error_stays_with_its_request(address, images, tmp_path):
+    expected = {path: inference.run_detection(path).to_dicts() for path in images}
+    inference.set_service(address)
+    missing = str(tmp_path / 'missing.png')
+    results = {}
+
+    def client(k):
+        # Half the clients send an image that doesn't exist, at the same time as the others
+        path = missing if k % 2 else images[k]
+        results[k] = inference.detect_holds(path, use_cache=False)
+
+    errors = run_clients(client)
+    assert len(errors) == n_clients // 2
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert sorted(results) == list(range(0, n_clients, 2))
+    for k, holds in results.items():
+        assert holds == expected[images[k]]
+
+    # The service keeps serving after the errors
+    assert inference.detect_holds(images[1], use_cache=False) == expected[images[1]]
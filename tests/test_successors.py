@@ -0,0 +1,106 @@
+# graph.generate_next_states against the original per-hold loop it replaced, on random walls and states:
+# the same successor states with the same g and h, bit for bit.
+import sys
+import os
+import math
+import random
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+import agent
+import graph
+import state
+import synthetic
+from hold_index import HoldIndex
+
+
+def euclidean_distance(pos1, pos2):
+    x1, y1 = tuple(pos1)
+    x2, y2 = tuple(pos2)
+    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+
+
+def reference_next_states(current_state, index, climber, goal_node, foot_hold_ids):
+    # generate_next_states before vectorization, one hold at a time
+    next_states = []
+    current = current_state.state
+    max_vertical_reach = climber.vertical_reach
+    max_horizontal_reach = climber.horizontal_reach * 0.8
+    hand_positions = {
+        "right_hand": index.get(current[state.RIGHT_HAND]),
+        "left_hand": index.get(current[state.LEFT_HAND])
+    }
+    foot_positions = {
+        "right_foot": index.get(current[state.RIGHT_FOOT]),
+        "left_foot": index.get(current[state.LEFT_FOOT])
+    }
+    lowest_hand_y = max(hand_positions["right_hand"]['center'][1], hand_positions["left_hand"]['center'][1])
+
+    for limb_idx, limb in enumerate(state.LIMBS):
+        for target_node in index:
+            if target_node['id'] == current[limb_idx]:
+                continue
+            if "hand" in limb:
+                if target_node['id'] in foot_hold_ids:
+                    continue
+                other_hand = "left_hand" if limb == "right_hand" else "right_hand"
+                if limb == "right_hand":
+                    if target_node['center'][0] < hand_positions[other_hand]['center'][0]:
+                        continue
+                elif target_node['center'][0] > hand_positions[other_hand]['center'][0]:
+                    continue
+                lowest_foot = foot_positions["right_foot"] if foot_positions["right_foot"]['center'][1] < \
+                    foot_positions["left_foot"]['center'][1] else foot_positions["left_foot"]
+                if euclidean_distance(target_node['center'], lowest_foot['center']) > max_vertical_reach:
+                    continue
+                if euclidean_distance(target_node['center'], hand_positions[other_hand]['center']) > max_horizontal_reach:
+                    continue
+                move_cost = 1
+                h = euclidean_distance(target_node['center'], goal_node['center'])
+            else:
+                other_foot = "left_foot" if limb == "right_foot" else "right_foot"
+                if target_node['id'] in foot_hold_ids and foot_positions[other_foot]['id'] == target_node['id']:
+                    continue
+                if target_node['id'] in (hand_positions["right_hand"]['id'], hand_positions["left_hand"]['id']):
+                    continue
+                if limb == "right_foot":
+                    if target_node['center'][0] < foot_positions["left_foot"]['center'][0]:
+                        continue
+                elif target_node['center'][0] > foot_positions["right_foot"]['center'][0]:
+                    continue
+                if target_node['center'][1] < lowest_hand_y + 0.4 * climber.height:
+                    continue
+                if euclidean_distance(target_node['center'], foot_positions[other_foot]['center']) > max_vertical_reach / 2:
+                    continue
+                move_cost = 3
+                h = min(
+                    euclidean_distance(target_node['center'], hand_positions["right_hand"]['center']),
+                    euclidean_distance(target_node['center'], hand_positions["left_hand"]['center'])
+                )
+
+            limb_positions = current[:limb_idx] + (target_node['id'],) + current[limb_idx + 1:]
+            next_states.append((limb_positions, current_state.g + move_cost, h))
+    return next_states
+
+
+def test_matches_reference_on_random_walls():
+    rng = random.Random(0)
+    checked = 0
+    for seed in range(200):
+        n_holds = rng.randint(8, 120)
+        holds = synthetic.generate_wall(n_holds, seed, 6.0, synthetic.wall_aspect(n_holds))
+        index = HoldIndex(holds)
+        climber = agent.climber(rng.uniform(100, 500))
+        goal_id = rng.choice(index.ids)
+        foot_hold_ids = set(rng.sample(index.ids, rng.randint(0, n_holds // 3)))
+        reach = index.reach(climber)
+        foot_mask = index.mask(foot_hold_ids)
+
+        for _ in range(10):
+            current = state.Node(F=0, g=rng.randint(0, 20), h=0, state=tuple(rng.choices(index.ids, k=4)),
+                                 parent=None)
+            expected = reference_next_states(current, index, climber, index.get(goal_id), foot_hold_ids)
+            actual = [(node.state, node.g, node.h) for node in
+                      graph.generate_next_states(current, index, reach, index.position[goal_id], foot_mask)]
+            assert sorted(actual) == sorted(expected)
+            checked += 1
+    assert checked == 2000
@@ -0,0 +1,35 @@
+# inference.merge_tile_edges: how boxes cut by inner tile edges are kept, dropped or joined
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+from inference import merge_tile_edges
+
+
+def merge(rows, tile_ids, cut):
+    return merge_tile_edges(np.array(rows, dtype=float), np.array(tile_ids), np.array(cut))
+
+
+def test_cut_box_dropped_when_another_tile_has_it_whole():
+    # Tiles 0 and 1 overlap on x 480-640, the hold at x 600-660 is cut by tile 0's right edge
+    result = merge([[600, 100, 640, 140, 0.8, 2], [600, 100, 660, 140, 0.9, 2]], [0, 1], [True, False])
+    assert result.tolist() == [[600, 100, 660, 140, 0.9, 2]]
+
+
+def test_hold_bigger_than_the_overlap_is_joined_from_its_pieces():
+    # x 300-900 is cut by tile 0's right edge (640) and tile 1's left edge (480), no tile sees it whole
+    result = merge([[300, 100, 640, 400, 0.7, 1], [480, 100, 900, 400, 0.6, 1]], [0, 1], [True, True])
+    assert result.tolist() == [[300, 100, 900, 400, 0.7, 1]]
+
+
+def test_pieces_of_different_classes_or_one_tile_stay_apart():
+    rows = [[300, 100, 640, 400, 0.7, 1], [480, 100, 900, 400, 0.6, 3], [500, 500, 640, 600, 0.5, 1],
+            [560, 520, 640, 640, 0.5, 1]]
+    result = merge(rows, [0, 1, 0, 0], [True, True, True, True])
+    assert sorted(result.tolist()) == sorted(rows)
+
+
+def test_whole_boxes_untouched():
+    rows = [[10, 10, 50, 50, 0.9, 0], [12, 12, 52, 52, 0.8, 0]]
+    assert merge(rows, [0, 1], [False, False]).tolist() == rows
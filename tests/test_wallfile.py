@@ -0,0 +1,51 @@
+# pathing/wallfile.py: a wall saved and loaded again maps every colour's planner hold ids back to the
+# detection ids they came from, and a file whose stored order doesn't match the holds is refused.
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pathing'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../ML'))
+import postprocess
+import synthetic
+import wallfile
+
+
+def two_colour_wall():
+    return postprocess.Holds.from_dicts(synthetic.generate_wall(40, 3, colours=['Pink', 'Blue']))
+
+
+def test_round_trip_keeps_detection_ids(tmp_path):
+    holds = two_colour_wall()
+    path = str(tmp_path / 'wall.npz')
+    wallfile.save_wall(path, holds, source_hash='abc', heights=(170,))
+    wall = wallfile.load_wall(path)
+
+    assert wall.source_hash == 'abc'
+    assert wall.colours() == ['Blue', 'Pink']
+    for colour in wall.colours():
+        # Detection ids of this colour, bottom to top like the planner numbers them
+        of_colour = holds.of_class(colour).sorted_by_y()
+        expected = of_colour.ids.tolist()
+        assert sorted(expected) != list(range(1, len(expected) + 1))
+        assert wall.orders[colour].tolist() == expected
+
+        planner = wall.planner(colour)
+        for hold in planner.holds:
+            detection_id = wall.detection_id(colour, hold['id'])
+            assert detection_id == hold['detection_id']
+            assert holds.boxes[holds.ids.tolist().index(detection_id)].tolist() == hold['box']
+
+
+def test_mismatched_order_is_refused(tmp_path):
+    path = str(tmp_path / 'wall.npz')
+    wallfile.save_wall(path, two_colour_wall())
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays['order/Pink'] = arrays['order/Pink'][::-1]
+    np.savez_compressed(path, **arrays)
+
+    wall = wallfile.load_wall(path)
+    with pytest.raises(AssertionError):
+        wall.planner('Pink')